@@ -0,0 +1,25 @@
+"""
+Gunicorn settings, read from the working directory on start
+
+Workers write their Prometheus samples to PROMETHEUS_MULTIPROC_DIR. The
+folder is emptied when the server starts and the live gauges of a worker
+are dropped when it exits, so /metrics only adds up running workers.
+"""
+import os
+import shutil
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Empties the metrics folder of a previous run"""
+    folder = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if folder:
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live gauges of a worker that exited"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -30,10 +30,13 @@ api = Api(
 
 # Dependencies require we import the routes AFTER the Flask app is created
 # pylint: disable=wrong-import-position, wrong-import-order, cyclic-import
-from service import routes, models  # noqa: E402, E261
+from service import routes, bulk_routes, change_routes, models  # noqa: E402, E261
 
 # pylint: disable=wrong-import-position
 from service.common import error_handlers, cli_commands  # noqa: F401, E402
+from service.common import compression, metrics, query_log, tracing  # noqa: E402
+
+compression.init_compression(app)
 
 # Set up logging for production
 log_handlers.init_logging(app, "gunicorn.error")
@@ -49,4 +52,8 @@ except Exception as error:  # pylint: disable=broad-except
     # gunicorn requires exit code 4 to stop spawning workers when they die
     sys.exit(4)
 
+query_log.init_query_log(app)
+metrics.init_metrics(app, models.db.engine.pool)
+tracing.init_tracing(app)
+
 app.logger.info("Service initialized!")
@@ -0,0 +1,230 @@
+"""
+Bulk Routes
+
+The endpoints that create, delete, deactivate and restore many Customers
+in one request
+"""
+import json
+from flask import abort, request
+from flask_restx import Resource, fields, reqparse, inputs
+from service.common import status  # HTTP Status Codes
+from service.models import Customer, DataValidationError
+from service.routes import (
+    NDJSON, bulk_filter_args, create_model, filtered_query, parse_args, request_payload
+)
+from . import app, api
+
+bulk_error_model = api.model(
+    "BulkError",
+    {
+        "index": fields.Integer(description="Position of the record in the request"),
+        "message": fields.String(description="Why the record was not created"),
+    },
+)
+
+bulk_count_model = api.model(
+    "BulkCount",
+    {"count": fields.Integer(description="The number of Customers affected")},
+)
+
+bulk_ids_model = api.model(
+    "BulkIds",
+    {
+        "ids": fields.List(
+            fields.Integer,
+            required=True,
+            description="The Customer ids, for lists too long to fit in the query string",
+        ),
+    },
+)
+
+bulk_result_model = api.model(
+    "BulkResult",
+    {
+        "ids": fields.List(
+            fields.String,
+            description="The new ids in request order, null where a record failed",
+        ),
+        "errors": fields.List(fields.Nested(bulk_error_model)),
+    },
+)
+
+# bulk create arguments
+bulk_args = reqparse.RequestParser()
+bulk_args.add_argument(
+    "atomic",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    default=False,
+    help="Create all of the Customers or none of them",
+)
+
+
+######################################################################
+#  R E S T   A P I   E N D P O I N T S
+######################################################################
+
+
+######################################################################
+#  PATH: /customers/bulk
+######################################################################
+@api.route("/customers/bulk", strict_slashes=False)
+class CustomerBulkCollection(Resource):
+    """Handles creating and deleting many Customers in one request"""
+
+    # ------------------------------------------------------------------
+    # ADD MANY NEW Customers
+    # ------------------------------------------------------------------
+    @api.doc("bulk_create_customers")
+    @api.response(400, "None of the posted Customers were valid")
+    @api.expect(bulk_args, [create_model])
+    @api.marshal_with(bulk_result_model, code=201)
+    def post(self):
+        """
+        Creates many Customers
+
+        This endpoint takes a JSON array or newline delimited JSON of Customers
+        and inserts them in batches. Invalid records are reported by index
+        unless atomic=true, where any error creates none of them.
+        """
+        app.logger.info("Request to Bulk Create Customers")
+        args = parse_args(bulk_args)
+        result = Customer.create_many(
+            bulk_records(), app.config["BULK_BATCH_SIZE"], args["atomic"]
+        )
+        created = len(result["ids"]) - result["ids"].count(None)
+        app.logger.info("[%s] Customers created in bulk", created)
+        if result["errors"] and not created:
+            return result, status.HTTP_400_BAD_REQUEST
+        return result, status.HTTP_201_CREATED
+
+    # ------------------------------------------------------------------
+    # DELETE MANY Customers
+    # ------------------------------------------------------------------
+    @api.doc("bulk_delete_customers")
+    @api.response(400, "No ids or filters were given")
+    @api.expect(bulk_filter_args, bulk_ids_model)
+    @api.marshal_with(bulk_count_model)
+    def delete(self):
+        """
+        Deletes many Customers
+
+        This endpoint deletes every Customer matching the ids or filters in one statement
+        The ids can also be sent in a JSON body as {"ids": [...]}
+        """
+        app.logger.info("Request to Bulk Delete Customers")
+        count = Customer.remove(bulk_query(parse_args(bulk_filter_args)))
+        app.logger.info("[%s] Customers deleted in bulk", count)
+        return {"count": count}, status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /customers/bulk/deactivate
+######################################################################
+@api.route("/customers/bulk/deactivate", strict_slashes=False)
+class BulkDeactivateResource(Resource):
+    """Handles deactivating many Customers at once"""
+
+    @api.doc("bulk_deactivate_customers")
+    @api.response(400, "No ids or filters were given")
+    @api.expect(bulk_filter_args, bulk_ids_model)
+    @api.marshal_with(bulk_count_model)
+    def put(self):
+        """
+        Deactivate many Customers
+
+        This endpoint deactivates every Customer matching the ids or filters in one statement
+        The ids can also be sent in a JSON body as {"ids": [...]}
+        """
+        app.logger.info("Request to Bulk Deactivate Customers")
+        count = Customer.set_status(bulk_query(parse_args(bulk_filter_args)), False)
+        app.logger.info("[%s] Customers deactivated in bulk", count)
+        return {"count": count}, status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /customers/bulk/restore
+######################################################################
+@api.route("/customers/bulk/restore", strict_slashes=False)
+class BulkRestoreResource(Resource):
+    """Handles restoring many Customers at once"""
+
+    @api.doc("bulk_restore_customers")
+    @api.response(400, "No ids or filters were given")
+    @api.expect(bulk_filter_args, bulk_ids_model)
+    @api.marshal_with(bulk_count_model)
+    def put(self):
+        """
+        Restore many Customers
+
+        This endpoint restores every Customer matching the ids or filters in one statement
+        The ids can also be sent in a JSON body as {"ids": [...]}
+        """
+        app.logger.info("Request to Bulk Restore Customers")
+        count = Customer.set_status(bulk_query(parse_args(bulk_filter_args)), True)
+        app.logger.info("[%s] Customers restored in bulk", count)
+        return {"count": count}, status.HTTP_200_OK
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+def bulk_query(args):
+    """Returns the Customer query a bulk operation applies to
+
+    Refuses to run without ids or filters so a mistake cannot change every Customer
+    """
+    ids = body_ids()
+    if ids is not None:
+        if args["ids"] is not None:
+            abort(
+                status.HTTP_400_BAD_REQUEST,
+                "Send the ids in the query string or in the body, not both.",
+            )
+        args = dict(args, ids=ids)
+    if all(value is None for value in args.values()):
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "A bulk operation needs a list of ids or at least one filter.",
+        )
+    return filtered_query(args)
+
+
+def body_ids():
+    """Returns the ids sent in the request body as {"ids": [...]}, or None without a body
+
+    A request line is limited to a few kilobytes, so long lists of ids go in the body
+    """
+    if not request.get_data():
+        return None
+    data = request_payload()
+    ids = data.get("ids") if isinstance(data, dict) else None
+    # ids are numbers, or strings of digits as the Customer responses return them
+    if not isinstance(ids, list) or not all(
+        (isinstance(customer_id, int) and not isinstance(customer_id, bool))
+        or (isinstance(customer_id, str) and customer_id.isdigit())
+        for customer_id in ids
+    ):
+        abort(status.HTTP_400_BAD_REQUEST, 'Expected a body like {"ids": [1, 2, 3]}')
+    return [int(customer_id) for customer_id in ids]
+
+
+def bulk_records():
+    """Returns the Customer records posted as a JSON array or as NDJSON"""
+    if request.mimetype == NDJSON:
+        return ndjson_records(request.stream)
+    data = request_payload()
+    if not isinstance(data, list):
+        abort(status.HTTP_400_BAD_REQUEST, "Expected a JSON array of Customers")
+    return data
+
+
+def ndjson_records(stream):
+    """Yields one record per non-blank line, or the error for a bad line"""
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                yield DataValidationError(f"Invalid JSON: {error}")
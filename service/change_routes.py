@@ -0,0 +1,138 @@
+"""
+Change Feed Routes
+
+The endpoint that lets other services mirror the Customers by reading
+only what changed since a cursor
+"""
+from flask_restx import Resource, fields, reqparse, inputs
+from service.common import status  # HTTP Status Codes
+from service.common.serializers import MEDIA_TYPES
+from service.models import Customer
+from service.routes import (
+    customer_model, customer_serializer, encoded_response, next_page_link, page_size, parse_args
+)
+from . import app, api
+
+
+def change_cursor(value: str) -> tuple:
+    """Parses a change feed cursor, "<txid>-<change id>" or 0 for the start"""
+    try:
+        parts = tuple(int(part) for part in value.split("-"))
+    except ValueError as error:
+        raise ValueError("since must be a cursor returned by the change feed") from error
+    if parts == (0,):
+        return (0, 0)
+    if len(parts) != 2 or min(parts) < 0:
+        raise ValueError("since must be a cursor returned by the change feed")
+    return parts
+
+
+def format_cursor(txid: int, change_id: int) -> str:
+    """Returns the change feed cursor of a change"""
+    return f"{txid}-{change_id}"
+
+
+change_model = api.model(
+    "CustomerChange",
+    {
+        "cursor": fields.String(description="The position of the change in the feed"),
+        "id": fields.String(description="The id of the Customer that changed"),
+        "deleted": fields.Boolean(description="The Customer was deleted"),
+        "customer": fields.Nested(
+            customer_model, allow_null=True, description="The Customer as it is now"
+        ),
+    },
+)
+
+change_page_model = api.model(
+    "CustomerChangePage",
+    {
+        "changes": fields.List(fields.Nested(change_model)),
+        "cursor": fields.String(description="Pass as since to get the next changes"),
+    },
+)
+
+# change feed arguments
+change_args = reqparse.RequestParser()
+change_args.add_argument(
+    "since",
+    type=change_cursor,
+    location="args",
+    required=False,
+    default=(0, 0),
+    help="Return the changes after this cursor, 0 for all of them",
+)
+change_args.add_argument(
+    "limit",
+    type=inputs.positive,
+    location="args",
+    required=False,
+    help="Maximum number of changes in a page",
+)
+
+
+######################################################################
+#  R E S T   A P I   E N D P O I N T S
+######################################################################
+
+
+######################################################################
+#  PATH: /customers/changes
+######################################################################
+@api.route("/customers/changes", strict_slashes=False)
+class CustomerChangeFeed(Resource):
+    """Lets other services mirror the Customers by reading only what changed"""
+
+    # ------------------------------------------------------------------
+    # LIST THE CHANGES AFTER A CURSOR
+    # ------------------------------------------------------------------
+    @api.doc("list_customer_changes")
+    @api.expect(change_args, validate=True)
+    @api.produces(list(MEDIA_TYPES))
+    @api.response(200, "Success", change_page_model)
+    def get(self):
+        """
+        Returns the Customers changed since a cursor
+
+        Each Customer is listed once, at its latest change, with its current
+        data or as deleted. Keep the returned cursor and pass it as since on
+        the next call; a Link header points to the next page while there is one.
+        """
+        args = parse_args(change_args)
+        app.logger.info("Request for customer changes since %s", args["since"])
+        limit = page_size(args)
+        changes = Customer.changes(args["since"], limit + 1)
+        headers = {}
+        if len(changes) > limit:
+            changes = changes[:limit]
+            headers = next_page_link(
+                CustomerChangeFeed, limit, since=format_cursor(changes[-1].txid, changes[-1].change_id)
+            )
+        cursor = format_cursor(changes[-1].txid, changes[-1].change_id) if changes else format_cursor(*args["since"])
+
+        app.logger.info("[%s] changes returned", len(changes))
+        return encoded_response(
+            {"changes": latest_changes(changes), "cursor": cursor},
+            status.HTTP_200_OK,
+            headers,
+        )
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+def latest_changes(changes) -> list:
+    """Returns one change per Customer, the latest, in cursor order"""
+    latest = {}
+    for change in changes:
+        latest.pop(change.id, None)
+        latest[change.id] = change
+    return [
+        {
+            "cursor": format_cursor(change.txid, change.change_id),
+            "id": str(change.id),
+            "deleted": change.first_name is None,
+            "customer": None if change.first_name is None else customer_serializer.from_row(change),
+        }
+        for change in latest.values()
+    ]
@@ -1,8 +1,11 @@
 """
 Flask CLI Command Extensions
 """
+import click
 from service import app
-from service.models import db
+from service.models import db, Customer, CustomerChange
+from service.common.compression import precompress_static
+from service.common.duplicates import find_duplicates
 
 
 ######################################################################
@@ -19,3 +22,78 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to add new tables, columns and indexes to an existing database
+# Usage:
+#   flask db-upgrade
+######################################################################
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """
+    Adds missing tables, columns and indexes to an existing database without touching the data
+    """
+    Customer.upgrade_schema()
+
+
+######################################################################
+# Command to delete old entries of the change feed
+# Usage:
+#   flask prune-changes --days 30
+######################################################################
+@app.cli.command("prune-changes")
+@click.option("--days", type=int, default=None, show_default="CHANGE_RETENTION_DAYS", help="Days of changes to keep")
+def prune_changes(days):
+    """
+    Deletes the change feed entries older than the retention period
+    """
+    if days is None:
+        days = app.config["CHANGE_RETENTION_DAYS"]
+    count = CustomerChange.prune(days)
+    click.echo(f"Deleted {count} changes older than {days} days")
+
+
+######################################################################
+# Command to build compressed copies of the static assets
+# Usage:
+#   flask compress-static
+######################################################################
+@app.cli.command("compress-static")
+def compress_static():
+    """
+    Writes .gz and .br files next to the static assets so they are served precompressed
+    """
+    count = precompress_static(app.static_folder)
+    click.echo(f"Wrote {count} compressed static files")
+
+
+######################################################################
+# Command to report Customers that were probably entered twice
+# Usage:
+#   flask find-duplicates --threshold 0.85 --processes 4 --limit 100
+######################################################################
+@app.cli.command("find-duplicates")
+@click.option("--threshold", default=0.85, show_default=True, help="Lowest similarity to report, 0 to 1")
+@click.option("--processes", default=1, show_default=True, help="Number of processes that compare Customers")
+@click.option("--limit", default=100, show_default=True, help="Most pairs to print")
+def find_duplicate_customers(threshold, processes, limit):
+    """
+    Reports likely duplicate Customers, most similar first
+    """
+    rows = Customer.stream(Customer.query, app.config["STREAM_BATCH_SIZE"])
+    pairs, skipped = find_duplicates(
+        ((row.id, row.first_name, row.last_name, row.address) for row in rows),
+        threshold,
+        processes,
+    )
+    shown = pairs[:limit]
+    ids = {customer_id for pair in shown for customer_id in (pair.id, pair.other_id)}
+    customers = {customer.id: customer for customer in Customer.search(ids=sorted(ids))}
+    for pair in shown:
+        first, second = customers[pair.id], customers[pair.other_id]
+        click.echo(
+            f"{pair.score:.2f}  {pair.id}: {first.first_name} {first.last_name}, {first.address!r}"
+            f"  <->  {pair.other_id}: {second.first_name} {second.last_name}, {second.address!r}"
+        )
+    click.echo(f"Found {len(pairs)} likely duplicates, skipped {skipped} oversized blocks")
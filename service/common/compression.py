@@ -0,0 +1,159 @@
+"""
+Compression
+
+This module compresses responses with gzip or brotli, chosen through the
+Accept-Encoding header. Dynamic responses are compressed when they are
+larger than COMPRESS_MIN_SIZE. Static assets are served from pre-built
+.br/.gz files made by "flask compress-static", or else compressed once
+and kept in memory, so they are never compressed on every request.
+"""
+import gzip
+import mimetypes
+import os
+from flask import request, current_app, send_from_directory, Response
+from werkzeug.security import safe_join
+from service.common.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# media types worth compressing, binary formats like images are already compressed
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/msgpack",
+    "application/cbor",
+    "image/svg+xml",
+}
+STATIC_SUFFIXES = {".html", ".css", ".js", ".json", ".svg", ".txt"}
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# static assets compressed in memory when no pre-built file exists
+_static_cache = LRUCache(maxsize=64, ttl=24 * 60 * 60)
+
+
+def init_compression(app):
+    """Registers the compression hooks with the Flask app"""
+    app.before_request(serve_precompressed)
+    app.after_request(compress_response)
+
+
+def supported_encodings() -> list:
+    """Returns the encodings this server can produce, best first"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def accepted_encoding() -> str:
+    """Returns the best encoding the client accepts or None"""
+    return request.accept_encodings.best_match(supported_encodings())
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compresses data with gzip or brotli at the configured level"""
+    if encoding == "br":
+        return brotli.compress(data, quality=current_app.config["COMPRESS_BROTLI_QUALITY"])
+    return gzip.compress(data, compresslevel=current_app.config["COMPRESS_LEVEL"], mtime=0)
+
+
+def is_compressible(mimetype: str) -> bool:
+    """Returns True for text based media types"""
+    return mimetype is not None and (mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES)
+
+
+######################################################################
+# Dynamic responses
+######################################################################
+def compress_response(response):
+    """Compresses a response body that is large enough to be worth it"""
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or not is_compressible(response.mimetype)
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.content_length or 0) < current_app.config["COMPRESS_MIN_SIZE"]:
+        return response
+    encoding = accepted_encoding()
+    if encoding is None:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    # a strong ETag must differ between the plain and compressed bodies
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+######################################################################
+# Static assets
+######################################################################
+def static_filename() -> str:
+    """Returns the static file a request asks for or None"""
+    if request.endpoint == "static":
+        return request.view_args["filename"]
+    if request.endpoint == "index":
+        return "index.html"
+    return None
+
+
+def serve_precompressed():
+    """Answers static requests with a pre-built or cached compressed file"""
+    filename = static_filename()
+    if filename is None or os.path.splitext(filename)[1] not in STATIC_SUFFIXES:
+        return None
+    encoding = accepted_encoding()
+    path = safe_join(current_app.static_folder, filename)
+    if encoding is None or path is None or not os.path.isfile(path):
+        return None
+    mimetype = mimetypes.guess_type(filename)[0]
+    prebuilt = path + ENCODING_SUFFIXES[encoding]
+    if os.path.isfile(prebuilt) and os.path.getmtime(prebuilt) >= os.path.getmtime(path):
+        response = send_from_directory(
+            current_app.static_folder, filename + ENCODING_SUFFIXES[encoding], mimetype=mimetype
+        )
+    else:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, encoding)
+        data = _static_cache.get(key)
+        if data is None:
+            with open(path, "rb") as file:
+                data = compress(file.read(), encoding)
+            _static_cache.set(key, data)
+        response = Response(data, mimetype=mimetype)
+        # like send_file the validators come from the file, with the encoding so
+        # that the plain and compressed bodies have different ETags
+        response.set_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}-{encoding}")
+        response.last_modified = stat.st_mtime
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def precompress_static(folder: str) -> int:
+    """Writes .gz and .br files next to every compressible static asset
+
+    Returns:
+        the number of compressed files written
+    """
+    count = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if os.path.splitext(name)[1] not in STATIC_SUFFIXES:
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as file:
+                data = file.read()
+            for encoding in supported_encodings():
+                with open(path + ENCODING_SUFFIXES[encoding], "wb") as file:
+                    file.write(compress(data, encoding))
+                count += 1
+    return count
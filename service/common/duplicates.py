@@ -0,0 +1,94 @@
+"""
+Duplicates
+
+This module finds Customers that are probably the same person entered
+more than once. Comparing every pair of Customers is quadratic, so each
+Customer is only compared with the others that share a blocking key:
+the same last name and first initial, or the same house number and
+street. Typos in one of them are caught through the other.
+"""
+import multiprocessing
+from collections import defaultdict, namedtuple
+from difflib import SequenceMatcher
+from functools import partial
+from service.common.normalize import normalize_text, normalize_address
+
+Duplicate = namedtuple("Duplicate", ["score", "id", "other_id"])
+
+
+def normalize_record(customer_id: int, first_name: str, last_name: str, address: str) -> tuple:
+    """Returns the (id, first name, last name, address) of a Customer normalized for comparing"""
+    return (
+        customer_id,
+        normalize_text(first_name),
+        normalize_text(last_name),
+        normalize_address(address),
+    )
+
+
+def blocking_keys(record: tuple) -> list:
+    """Returns the keys of the blocks a normalized record is compared within"""
+    _, first_name, last_name, address = record
+    keys = []
+    if last_name:
+        keys.append(f"name:{last_name} {first_name[:1]}")
+    tokens = address.split()
+    numbers = [token for token in tokens if token.isdigit()]
+    words = [token for token in tokens if not token.isdigit()]
+    if numbers and words:
+        keys.append(f"address:{numbers[0]} {words[0]}")
+    return keys
+
+
+def similarity(text: str, other: str) -> float:
+    """Returns how alike two strings are, from 0.0 to 1.0"""
+    return SequenceMatcher(None, text, other).ratio()
+
+
+def score_block(block: list, threshold: float) -> list:
+    """Returns the Duplicates among the records of one block that score at least threshold"""
+    duplicates = []
+    for position, record in enumerate(block):
+        for other in block[position + 1:]:
+            name = similarity(f"{record[1]} {record[2]}", f"{other[1]} {other[2]}")
+            score = (name + similarity(record[3], other[3])) / 2
+            if score >= threshold:
+                first, second = sorted((record[0], other[0]))
+                duplicates.append(Duplicate(round(score, 4), first, second))
+    return duplicates
+
+
+def find_duplicates(
+    rows, threshold: float = 0.85, processes: int = 1, max_block_size: int = 200
+) -> tuple:
+    """Finds the likely duplicates among Customers
+
+    Args:
+        rows: an iterable of (id, first name, last name, address) tuples
+        threshold (float): the lowest similarity reported, from 0.0 to 1.0
+        processes (int): the number of processes that score the blocks
+        max_block_size (int): blocks larger than this are too common to be
+            useful and are skipped so the work stays near linear
+
+    Returns:
+        the Duplicates, most similar first, and the number of skipped blocks
+    """
+    blocks = defaultdict(list)
+    for row in rows:
+        record = normalize_record(*row)
+        for key in blocking_keys(record):
+            blocks[key].append(record)
+    candidates = [block for block in blocks.values() if 1 < len(block) <= max_block_size]
+    skipped = sum(1 for block in blocks.values() if len(block) > max_block_size)
+
+    score = partial(score_block, threshold=threshold)
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            results = list(pool.imap_unordered(score, candidates, chunksize=64))
+    else:
+        results = map(score, candidates)
+
+    # a pair that shares both keys is scored twice with the same result
+    duplicates = {(d.id, d.other_id): d for result in results for d in result}
+    ranked = sorted(duplicates.values(), key=lambda d: (-d.score, d.id, d.other_id))
+    return ranked, skipped
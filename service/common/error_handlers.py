@@ -18,7 +18,7 @@
 Module: error_handlers
 """
 from flask import jsonify
-from service.models import DataValidationError
+from service.models import DataValidationError, ConflictError
 from service import app
 from . import status
 
@@ -32,6 +32,12 @@ def request_validation_error(error):
     return bad_request(error)
 
 
+@app.errorhandler(ConflictError)
+def version_conflict(error):
+    """Handles writes to Customers that changed since they were read"""
+    return resource_conflict(error)
+
+
 @app.errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad requests with 400_BAD_REQUEST"""
@@ -86,6 +92,21 @@ def resource_conflict(error):
     )
 
 
+@app.errorhandler(status.HTTP_412_PRECONDITION_FAILED)
+def precondition_failed(error):
+    """Handles failed If-Match preconditions with HTTP_412_PRECONDITION_FAILED"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_412_PRECONDITION_FAILED,
+            error="Precondition Failed",
+            message=message,
+        ),
+        status.HTTP_412_PRECONDITION_FAILED,
+    )
+
+
 @app.errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
 def mediatype_not_supported(error):
     """Handles unsupported media requests with 415_UNSUPPORTED_MEDIA_TYPE"""
@@ -101,6 +122,21 @@ def mediatype_not_supported(error):
     )
 
 
+@app.errorhandler(status.HTTP_422_UNPROCESSABLE_ENTITY)
+def unprocessable_entity(error):
+    """Handles well formed requests that cannot be processed with HTTP_422_UNPROCESSABLE_ENTITY"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            error="Unprocessable Entity",
+            message=message,
+        ),
+        status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
 @app.errorhandler(status.HTTP_500_INTERNAL_SERVER_ERROR)
 def internal_server_error(error):
     """Handles unexpected server error with 500_SERVER_ERROR"""
@@ -0,0 +1,72 @@
+"""
+Health
+
+This module checks whether the service can reach its database for the
+readiness probe. A check runs SELECT 1 through the connection pool on a
+background thread. Its outcome is kept for HEALTH_CHECK_TTL seconds and
+only one check runs at a time, so probes never pile up queries on the
+database. A check that takes longer than HEALTH_CHECK_TIMEOUT seconds
+counts as a failure, so an unreachable database fails the probe quickly.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from sqlalchemy import text
+
+
+def ping(engine) -> dict:
+    """Runs SELECT 1 on a pooled connection and returns how it went"""
+    start = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1")).scalar()
+    except Exception as error:  # pylint: disable=broad-except
+        return {"status": "down", "error": f"{type(error).__name__}: {error}".splitlines()[0]}
+    return {"status": "up", "latency_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+
+def pool_status(pool) -> dict:
+    """Returns how many connections of a pool are in use"""
+    if not hasattr(pool, "size"):
+        return {}
+    size = pool.size()
+    checked_out = pool.checkedout()
+    return {
+        "size": size,
+        "checked_out": checked_out,
+        "overflow": max(pool.overflow(), 0),
+        "saturation": round(checked_out / size, 2) if size else None,
+    }
+
+
+class DatabaseCheck:
+    """Pings the database at most once per ttl, waiting at most timeout seconds"""
+
+    def __init__(self, ttl: float, timeout: float):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="health-check")
+        self._pending = None
+        self._result = None
+        self._checked_at = None
+
+    def check(self, engine) -> dict:
+        """Returns the outcome of the last ping, pinging again once it is older than ttl"""
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.ttl:
+                return self._result
+            # a ping that is still running is waited on again instead of starting another
+            if self._pending is None:
+                self._pending = self._executor.submit(ping, engine)
+            pending = self._pending
+        try:
+            result = pending.result(timeout=self.timeout)
+        except FutureTimeout:
+            result = {"status": "down", "error": f"no answer within {self.timeout} seconds"}
+        with self._lock:
+            if pending.done() and self._pending is pending:
+                self._pending = None
+            self._result = result
+            self._checked_at = time.monotonic()
+        return result
@@ -0,0 +1,155 @@
+"""
+Idempotency
+
+This module remembers the response to a request sent with an
+Idempotency-Key header, so a client that retries after a timeout gets
+the first response back instead of repeating the write. Keys expire
+after IDEMPOTENCY_KEY_TTL seconds. The memory store only covers one
+process, the database store is shared by every worker. A worker that
+dies mid-request leaves its key claimed in the database store for only
+IDEMPOTENCY_LOCK_SECONDS, after which a retry takes the key over.
+"""
+import json
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from service.common.cache import LRUCache
+from service.models import db
+
+# a response with no status is still being produced by the first request
+StoredResponse = namedtuple("StoredResponse", ["fingerprint", "status", "headers", "body"])
+
+
+class IdempotencyKey(db.Model):
+    """
+    Class that remembers the response to a request sent with an Idempotency-Key
+
+    A key is claimed before the request runs, so retries from any worker
+    see it. The status stays empty until the response is saved, which
+    marks a request that is still in progress. The claim is a lease that
+    ends at locked_until, so a key held by a worker that was killed does
+    not stay locked until it expires.
+    """
+
+    __tablename__ = "idempotency_key"
+
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer)
+    headers = db.Column(db.Text)
+    body = db.Column(db.LargeBinary)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    locked_until = db.Column(db.DateTime)
+
+    @classmethod
+    def claim(cls, key: str, fingerprint: str, ttl: int, lease: int):
+        """Claims a key for a request, removing every expired key first
+
+        A key whose request never saved a response is taken over once its
+        lease of a few seconds has run out.
+
+        Returns:
+            None when the key was claimed, else the IdempotencyKey that holds it
+        """
+        table = cls.__table__
+        now = datetime.utcnow()
+        claim = {
+            "fingerprint": fingerprint,
+            "expires_at": now + timedelta(seconds=ttl),
+            "locked_until": now + timedelta(seconds=lease),
+        }
+        db.session.execute(table.delete().where(table.c.expires_at < now))
+        try:
+            db.session.execute(table.insert().values(key=key, **claim))
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+        # only one retry can win the row, the others see the new lease
+        abandoned = db.session.execute(
+            table.update()
+            .where(
+                table.c.key == key,
+                table.c.status.is_(None),
+                db.or_(table.c.locked_until.is_(None), table.c.locked_until < now),
+            )
+            .values(**claim)
+        )
+        db.session.commit()
+        if abandoned.rowcount == 1:
+            return None
+        existing = db.session.get(cls, key, populate_existing=True)
+        # the holder may have released the key since the insert failed
+        return existing if existing is not None else cls.claim(key, fingerprint, ttl, lease)
+
+    @classmethod
+    def save(cls, key: str, status: int, headers: str, body: bytes):
+        """Stores the response for a claimed key"""
+        table = cls.__table__
+        db.session.execute(
+            table.update().where(table.c.key == key).values(status=status, headers=headers, body=body)
+        )
+        db.session.commit()
+
+    @classmethod
+    def release(cls, key: str):
+        """Forgets a claimed key so the request can be tried again"""
+        db.session.rollback()
+        db.session.execute(cls.__table__.delete().where(cls.__table__.c.key == key))
+        db.session.commit()
+
+
+class MemoryStore:
+    """Keeps responses in a bounded in-process LRU cache"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = LRUCache(maxsize, ttl)
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, fingerprint: str):
+        """Returns the StoredResponse for key, or None after claiming key"""
+        with self._lock:
+            stored = self._cache.get(key)
+            if stored is None:
+                self._cache.set(key, StoredResponse(fingerprint, None, None, None))
+            return stored
+
+    def save(self, key: str, stored: StoredResponse):
+        """Stores the response for a claimed key"""
+        self._cache.set(key, stored)
+
+    def release(self, key: str):
+        """Forgets a claimed key so the request can be tried again"""
+        self._cache.delete(key)
+
+
+class DatabaseStore:
+    """Keeps responses in the idempotency_key table"""
+
+    def __init__(self, ttl: int, lease: int):
+        self.ttl = ttl
+        self.lease = lease
+
+    def claim(self, key: str, fingerprint: str):
+        """Returns the StoredResponse for key, or None after claiming key"""
+        row = IdempotencyKey.claim(key, fingerprint, self.ttl, self.lease)
+        if row is None:
+            return None
+        headers = json.loads(row.headers) if row.headers else None
+        return StoredResponse(row.fingerprint, row.status, headers, row.body)
+
+    def save(self, key: str, stored: StoredResponse):
+        """Stores the response for a claimed key"""
+        IdempotencyKey.save(key, stored.status, json.dumps(stored.headers), stored.body)
+
+    def release(self, key: str):
+        """Forgets a claimed key so the request can be tried again"""
+        IdempotencyKey.release(key)
+
+
+def init_store(config):
+    """Returns the store selected by IDEMPOTENCY_STORE"""
+    if config["IDEMPOTENCY_STORE"] == "database":
+        return DatabaseStore(config["IDEMPOTENCY_KEY_TTL"], config["IDEMPOTENCY_LOCK_SECONDS"])
+    return MemoryStore(config["IDEMPOTENCY_CACHE_SIZE"], config["IDEMPOTENCY_KEY_TTL"])
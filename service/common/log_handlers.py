@@ -18,19 +18,141 @@
 Log Handlers
 
 This module contains utility functions to set up logging
-consistently
+consistently. With LOG_FORMAT=json the records are formatted as JSON
+and written by a background thread, so requests never wait on stdout.
 """
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from flask import current_app, g, request, has_request_context
+
+REQUEST_ID_HEADER = "X-Request-ID"
 
 
 def init_logging(app, logger_name: str):
     """Set up logging for production"""
     app.logger.propagate = False
     gunicorn_logger = logging.getLogger(logger_name)
-    app.logger.handlers = gunicorn_logger.handlers
+    handlers = gunicorn_logger.handlers
     app.logger.setLevel(gunicorn_logger.level)
-    # Make all log formats consistent
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
-    for handler in app.logger.handlers:
-        handler.setFormatter(formatter)
+    app.logger.addFilter(RequestFilter())
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    if app.config["LOG_FORMAT"] == "json":
+        handlers = handlers or [logging.StreamHandler(sys.stdout)]
+        for handler in handlers:
+            handler.setFormatter(JsonFormatter())
+        # an unbounded queue, so a slow stdout never blocks a request
+        records = queue.SimpleQueue()
+        listener = QueueListener(records, *handlers, respect_handler_level=True)
+        listener.start()
+        app.extensions["log_listener"] = listener
+        atexit.register(stop_logging, app)
+        app.logger.handlers = [JsonQueueHandler(records)]
+    else:
+        # Make all log formats consistent
+        formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        app.logger.handlers = handlers
     app.logger.info("Logging handler established")
+
+
+def stop_logging(app):
+    """Writes the queued records and stops the background thread, if there is one"""
+    listener = app.extensions.pop("log_listener", None)
+    if listener is not None:
+        listener.stop()
+
+
+class RequestFilter(logging.Filter):
+    """Tags records with their request id and drops the INFO lines of unsampled requests
+
+    Filters run in the thread that logs, so the request is still at hand
+    even when the record is written by the queue listener.
+    """
+
+    def filter(self, record) -> bool:
+        if not has_request_context():
+            return True
+        record.request_id = g.get("request_id")
+        return record.levelno > logging.INFO or g.get("log_sampled", True)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of JSON"""
+
+    # extra attributes of a record that are copied into the JSON
+    EXTRA_FIELDS = ("request_id", "method", "path", "status", "duration_ms")
+
+    def format(self, record) -> str:
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        for name in self.EXTRA_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class JsonQueueHandler(QueueHandler):
+    """Queues records for the listener thread with their traceback kept apart
+
+    QueueHandler.prepare() merges the traceback into the message and drops
+    exc_info, which would leave JsonFormatter nothing for "exception".
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+######################################################################
+# Request hooks
+######################################################################
+def start_request():
+    """Gives a request its id and decides whether its INFO lines are logged"""
+    g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+    g.log_sampled = random.random() < current_app.config["LOG_SAMPLE_RATE"]
+
+
+def finish_request(response):
+    """Logs how a request ended and returns its id to the client"""
+    start = g.get("request_start")
+    if start is not None:
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        current_app.logger.info(
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            },
+        )
+    return response
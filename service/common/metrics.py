@@ -0,0 +1,132 @@
+"""
+Metrics
+
+This module exposes Prometheus metrics at /metrics: request counts and
+latencies per route, requests in flight, the database connection pool
+and the SQL statements in the QueryLog of each request. Under gunicorn
+every worker writes its samples to PROMETHEUS_MULTIPROC_DIR and a scrape
+of any worker adds them all up; without it the metrics cover one process.
+"""
+import os
+import threading
+import time
+from flask import g, request, Response
+from sqlalchemy import event
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram, multiprocess
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+# buckets for the number of SQL statements one request runs
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+if prometheus_client is not None:
+    # gauges without labels write their samples as soon as they are created, so the
+    # folder must exist before gunicorn makes it, for example for the flask commands
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+    REQUEST_COUNT = Counter(
+        "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+    )
+    REQUEST_LATENCY = Histogram(
+        "http_request_duration_seconds", "Time spent handling HTTP requests", ["method", "route"]
+    )
+    REQUESTS_IN_FLIGHT = Gauge(
+        "http_requests_in_flight",
+        "HTTP requests being handled",
+        ["method", "route"],
+        multiprocess_mode="livesum",
+    )
+    POOL_CHECKED_OUT = Gauge(
+        "db_pool_checked_out", "Database connections in use", multiprocess_mode="livesum"
+    )
+    POOL_OVERFLOW = Gauge(
+        "db_pool_overflow",
+        "Database connections opened beyond the pool size",
+        multiprocess_mode="livesum",
+    )
+    QUERY_COUNT = Histogram(
+        "db_queries_per_request", "SQL statements run by one HTTP request", ["route"], buckets=QUERY_BUCKETS
+    )
+    QUERY_DURATION = Histogram(
+        "db_query_duration_seconds_per_request", "Time one HTTP request spent in SQL statements", ["route"]
+    )
+
+
+def init_metrics(app, pool):
+    """Registers the metrics hooks and the /metrics endpoint with the Flask app"""
+    if prometheus_client is None:  # pragma: no cover
+        app.logger.warning("prometheus_client is not installed, metrics are disabled")
+        return
+    app.before_request(start_request)
+    app.after_request(record_request)
+    app.teardown_request(finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
+    watch_pool(pool)
+
+
+def route_label() -> str:
+    """Returns the route template of the request, so ids do not make new series"""
+    return request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+
+def start_request():
+    """Starts timing a request"""
+    g.metrics_route = route_label()
+    g.metrics_start = time.perf_counter()
+    REQUESTS_IN_FLIGHT.labels(request.method, g.metrics_route).inc()
+
+
+def record_request(response):
+    """Counts a request and records its latency and SQL statements"""
+    start = g.get("metrics_start")
+    if start is not None:
+        route = g.metrics_route
+        REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - start)
+        REQUEST_COUNT.labels(request.method, route, response.status_code).inc()
+        queries = g.get("query_log")
+        if queries is not None:
+            QUERY_COUNT.labels(route).observe(queries.count)
+            QUERY_DURATION.labels(route).observe(queries.seconds)
+    return response
+
+
+def finish_request(error=None):  # pylint: disable=unused-argument
+    """Takes a request out of the in flight gauge, even when it failed"""
+    if g.pop("metrics_start", None) is not None:
+        REQUESTS_IN_FLIGHT.labels(request.method, g.metrics_route).dec()
+
+
+def metrics():
+    """Returns the metrics of every worker in the Prometheus text format"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+######################################################################
+# Database
+######################################################################
+def watch_pool(pool):
+    """Updates the pool gauges whenever a connection is checked out or in
+
+    The checkin event fires before the pool takes the connection back, so
+    the connections in use are counted here instead of asking the pool.
+    """
+    size = pool.size() if hasattr(pool, "size") else None
+    lock = threading.Lock()
+    in_use = [0]
+
+    def change(delta: int):
+        with lock:
+            in_use[0] += delta
+            POOL_CHECKED_OUT.set(in_use[0])
+            POOL_OVERFLOW.set(max(in_use[0] - size, 0) if size is not None else 0)
+
+    event.listen(pool, "checkout", lambda *_: change(1))
+    event.listen(pool, "checkin", lambda *_: change(-1))
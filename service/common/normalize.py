@@ -0,0 +1,45 @@
+"""
+Normalize
+
+This module reduces names and addresses to a canonical form so that
+spellings which only differ in case, spacing, punctuation or common
+abbreviations compare equal
+"""
+import re
+
+# long forms of common address words and their postal abbreviations
+ABBREVIATIONS = {
+    "apartment": "apt",
+    "avenue": "ave",
+    "boulevard": "blvd",
+    "circle": "cir",
+    "court": "ct",
+    "drive": "dr",
+    "east": "e",
+    "highway": "hwy",
+    "lane": "ln",
+    "north": "n",
+    "parkway": "pkwy",
+    "place": "pl",
+    "road": "rd",
+    "south": "s",
+    "square": "sq",
+    "street": "st",
+    "suite": "ste",
+    "terrace": "ter",
+    "west": "w",
+}
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+def normalize_text(text: str) -> str:
+    """Returns text in lower case without punctuation and with single spaces"""
+    return " ".join(_PUNCTUATION.sub(" ", text.casefold()).split())
+
+
+def normalize_address(address: str) -> str:
+    """Returns an address normalized like text with its common words abbreviated"""
+    return " ".join(
+        ABBREVIATIONS.get(token, token) for token in normalize_text(address).split()
+    )
@@ -0,0 +1,122 @@
+"""
+Query Log
+
+This module counts and times the SQL statements of every request, so
+tests can pin how many statements an endpoint runs and QUERY_BUDGET can
+flag a request that runs too many. Statements slower than
+SLOW_QUERY_SECONDS are logged without their bound parameters.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("flask.app")
+
+
+class QueryBudgetExceeded(Exception):
+    """Used when a request runs more SQL statements than QUERY_BUDGET allows"""
+
+
+class QueryLog:  # pylint: disable=too-few-public-methods
+    """Counts and times the SQL statements run while it is active"""
+
+    # statements that take at least this many seconds are logged, 0 disables
+    slow_seconds = 0.0
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+    def add(self, statement: str, seconds: float):
+        """Records one finished statement"""
+        self.count += 1
+        self.seconds += seconds
+        self.statements.append(statement)
+
+
+# the QueryLogs that every statement is added to
+_active_logs = ContextVar("active_query_logs", default=())
+
+
+def start_query_log() -> QueryLog:
+    """Returns a new QueryLog that records the statements from now on"""
+    log = QueryLog()
+    _active_logs.set(_active_logs.get() + (log,))
+    return log
+
+
+def stop_query_log(log: QueryLog):
+    """Stops recording statements in a QueryLog"""
+    _active_logs.set(tuple(active for active in _active_logs.get() if active is not log))
+
+
+@contextmanager
+def count_queries():
+    """Counts the SQL statements run inside a with block
+
+    with count_queries() as queries:
+        client.get("/api/customers/1")
+    assert queries.count == 1
+    """
+    log = start_query_log()
+    try:
+        yield log
+    finally:
+        stop_query_log(log)
+
+
+def init_query_log(app):
+    """Records the SQL statements of every request and enforces QUERY_BUDGET"""
+    QueryLog.slow_seconds = app.config["SLOW_QUERY_SECONDS"]
+    app.before_request(_start_request_log)
+    app.after_request(_check_query_budget)
+    app.teardown_request(_stop_request_log)
+
+
+def _start_request_log():
+    """Opens the QueryLog of a request"""
+    g.query_log = start_query_log()
+
+
+def _check_query_budget(response):
+    """Raises under test and warns otherwise when a request ran too many statements"""
+    log = g.get("query_log")
+    budget = current_app.config["QUERY_BUDGET"]
+    if log is not None and 0 < budget < log.count:
+        message = f"{request.method} {request.path} ran {log.count} SQL statements, over the budget of {budget}"
+        if current_app.testing:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    return response
+
+
+def _stop_request_log(error=None):  # pylint: disable=unused-argument
+    """Closes the QueryLog of a request, even when it failed"""
+    log = g.get("query_log")
+    if log is not None:
+        stop_query_log(log)
+
+
+# pylint: disable=too-many-arguments, unused-argument
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    """Notes when a statement starts, a connection runs one at a time"""
+    conn.info["statement_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    """Adds a finished statement to the active QueryLogs and logs it if it was slow"""
+    elapsed = time.perf_counter() - conn.info["statement_start"]
+    for log in _active_logs.get():
+        log.add(statement, elapsed)
+    if 0 < QueryLog.slow_seconds <= elapsed:
+        # only the SQL is logged, the bound parameters may hold customer data
+        (current_app.logger if has_app_context() else logger).warning(
+            "Slow SQL statement took %.3fs: %s [parameters redacted]", elapsed, " ".join(statement.split())
+        )
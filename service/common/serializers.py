@@ -0,0 +1,114 @@
+"""
+Serializers
+
+This module contains a fast replacement for flask-restx marshalling.
+A ModelSerializer is built once from a flask-restx model, so responses
+keep the documented schema without walking the field definitions for
+every object.
+"""
+import json
+from operator import attrgetter, itemgetter
+from flask_restx import fields
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps(data) -> bytes:
+    """Encodes data as compact JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return _encoder.encode(data).encode("utf-8")  # pragma: no cover
+
+
+def _media_types() -> dict:
+    """Returns the (encode, decode) pair for every supported media type"""
+    media_types = {JSON: (dumps, json.loads)}
+    if msgpack is not None:
+        codec = (msgpack.packb, msgpack.unpackb)
+        media_types[MSGPACK] = codec
+        media_types["application/x-msgpack"] = codec
+    if cbor2 is not None:
+        media_types[CBOR] = (cbor2.dumps, cbor2.loads)
+    return media_types
+
+
+# JSON is listed first so it stays the default for */* and unknown types
+MEDIA_TYPES = _media_types()
+
+
+def encode(data, media_type: str) -> bytes:
+    """Encodes data in one of the MEDIA_TYPES"""
+    return MEDIA_TYPES[media_type][0](data)
+
+
+def decode(body: bytes, media_type: str):
+    """Decodes a body in one of the MEDIA_TYPES, raising ValueError if it is malformed"""
+    try:
+        return MEDIA_TYPES[media_type][1](body)
+    except ValueError:
+        raise
+    except Exception as error:  # pylint: disable=broad-except
+        # msgpack and cbor2 raise their own exception types for bad input
+        raise ValueError(str(error)) from error
+
+
+# how flask-restx formats the value of each field type
+FIELD_FORMATS = ((fields.String, str), (fields.Boolean, bool), (fields.Integer, int))
+
+
+def _nullable(convert):
+    """Wraps a conversion so None is passed through like marshal() does"""
+    return lambda value: None if value is None else convert(value)
+
+
+def _converter(field):
+    """Returns the function that formats a value the way the field would"""
+    for field_type, convert in FIELD_FORMATS:
+        if isinstance(field, field_type):
+            return _nullable(convert)
+    return lambda value: value
+
+
+class ModelSerializer:
+    """Serializes rows or dictionaries into the shape of a flask-restx model
+
+    Args:
+        model: the flask-restx model that documents the output
+        attributes (dict): maps output names to row attributes where they differ
+    """
+
+    def __init__(self, model, attributes: dict = None):
+        attributes = attributes or {}
+        self._row_fields = []
+        self._dict_fields = []
+        for name, field in model.resolved.items():
+            convert = _converter(field)
+            self._row_fields.append((name, attrgetter(attributes.get(name, name)), convert))
+            self._dict_fields.append((name, itemgetter(name), convert))
+
+    def from_row(self, row) -> dict:
+        """Returns the model dictionary for a result row or object"""
+        return {name: convert(get(row)) for name, get, convert in self._row_fields}
+
+    def from_dict(self, data: dict) -> dict:
+        """Returns the model dictionary for an already serialized dictionary"""
+        return {name: convert(get(data)) for name, get, convert in self._dict_fields}
@@ -0,0 +1,238 @@
+"""
+Tracing
+
+This module records a span for every sampled request, with child spans
+for its SQL statements, argument parsing and response encoding. The
+trace context comes in and goes out in the W3C traceparent header.
+Finished traces are handed to an exporter: the default appends each
+trace to TRACE_FILE as one line of OTLP JSON, which an OpenTelemetry
+collector can read with its otlpjsonfile receiver.
+"""
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SERVICE_NAME = "customers"
+TRACEPARENT_HEADER = "traceparent"
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# OTLP span kinds and the error status code
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+# the span that new child spans belong to, None when the request is not traced
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed operation of a trace
+
+    The finished spans of a trace are collected in a list shared by all of
+    them, which is exported once the root span finishes.
+    """
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, kind: int = INTERNAL, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start = time.time_ns()
+        self.end = None
+        self.error = None
+        self.trace = []
+
+    def child(self, name: str, kind: int = INTERNAL, attributes: dict = None):
+        """Returns a new span inside this one"""
+        span = Span(name, self.trace_id, self.span_id, kind, attributes)
+        span.trace = self.trace
+        return span
+
+    def finish(self, error: Exception = None):
+        """Ends the span and adds it to its trace"""
+        self.end = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.trace.append(self)
+
+    def to_otlp(self) -> dict:
+        """Returns the span in the OTLP JSON encoding"""
+        data = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            data["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return data
+
+
+def otlp_value(value) -> dict:
+    """Returns an attribute value in the OTLP JSON encoding"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_request(spans: list) -> dict:
+    """Returns spans wrapped in an OTLP ExportTraceServiceRequest"""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}],
+            }
+        ]
+    }
+
+
+class FileExporter:  # pylint: disable=too-few-public-methods
+    """Appends every trace to a file as one line of OTLP JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list):
+        """Writes the finished spans of one trace"""
+        line = json.dumps(otlp_request(spans), separators=(",", ":")) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(line)
+
+
+@contextmanager
+def span(name: str, attributes: dict = None):
+    """Times the with block as a child of the current span, if the request is traced"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, attributes=attributes)
+    token = _current_span.set(child)
+    error = None
+    try:
+        yield child
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish(error)
+
+
+######################################################################
+# Request hooks
+######################################################################
+def init_tracing(app, exporter=None):
+    """Traces the sampled requests of the Flask app
+
+    Args:
+        app: the Flask app
+        exporter: anything with an export(spans) method, by default a
+            FileExporter that writes to TRACE_FILE
+    """
+    app.extensions["trace_exporter"] = exporter or FileExporter(app.config["TRACE_FILE"])
+    app.before_request(start_trace)
+    app.after_request(propagate_trace)
+    app.teardown_request(finish_trace)
+
+
+def start_trace():
+    """Continues the caller's trace or starts a new one, and samples it"""
+    match = TRACEPARENT.match(request.headers.get(TRACEPARENT_HEADER, ""))
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        sampled = int(flags, 16) & 1 == 1
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+        sampled = random.random() < current_app.config["TRACE_SAMPLE_RATE"]
+    g.trace_id = trace_id
+    g.trace_parent_id = parent_id
+    if sampled:
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        root = Span(
+            f"{request.method} {rule}",
+            trace_id,
+            parent_id,
+            SERVER,
+            {"http.method": request.method, "http.route": rule, "http.target": request.full_path.rstrip("?")},
+        )
+        g.trace_span = root
+        _current_span.set(root)
+
+
+def propagate_trace(response):
+    """Returns the trace context to the caller in the traceparent header"""
+    if "trace_id" in g:
+        root = g.get("trace_span")
+        if root is not None:
+            root.attributes["http.status_code"] = response.status_code
+            response.headers[TRACEPARENT_HEADER] = f"00-{root.trace_id}-{root.span_id}-01"
+        elif g.trace_parent_id is not None:
+            response.headers[TRACEPARENT_HEADER] = f"00-{g.trace_id}-{g.trace_parent_id}-00"
+    return response
+
+
+def finish_trace(error=None):
+    """Ends the request span and exports its trace"""
+    root = g.pop("trace_span", None)
+    if root is None:
+        return
+    _current_span.set(None)
+    root.finish(error)
+    try:
+        current_app.extensions["trace_exporter"].export(root.trace)
+    except OSError as exc:
+        current_app.logger.warning("Could not export trace %s: %s", root.trace_id, exc)
+
+
+######################################################################
+# Database
+######################################################################
+# pylint: disable=too-many-arguments, unused-argument
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    """Starts a span for a SQL statement of a traced request, without its parameters"""
+    parent = _current_span.get()
+    if parent is not None:
+        conn.info["trace_span"] = parent.child(
+            f"db {statement.split(None, 1)[0]}",
+            CLIENT,
+            {"db.system": conn.dialect.name, "db.statement": statement},
+        )
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    """Ends the span of a SQL statement"""
+    statement_span = conn.info.pop("trace_span", None)
+    if statement_span is not None:
+        statement_span.finish()
+
+
+@event.listens_for(Engine, "handle_error")
+def _failed_statement(context):
+    """Ends the span of a SQL statement that raised"""
+    if context.connection is not None:
+        statement_span = context.connection.info.pop("trace_span", None)
+        if statement_span is not None:
+            statement_span.finish(context.original_exception)
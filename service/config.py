@@ -14,3 +14,62 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
+
+# Hard server-side cap on the number of Customers returned in one page
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Number of rows fetched per round trip when streaming Customers
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+# Per worker cache of serialized Customers, disabled when the size is 0.
+# Other workers only see a change once their entry expires after the TTL.
+CUSTOMER_CACHE_SIZE = int(os.getenv("CUSTOMER_CACHE_SIZE", "0"))
+CUSTOMER_CACHE_TTL = float(os.getenv("CUSTOMER_CACHE_TTL", "30"))
+
+# Number of Customers inserted per statement and commit by the bulk endpoint
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+
+# Responses smaller than this many bytes are not worth compressing
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# gzip level (1-9) and brotli quality (0-11): higher is smaller but slower
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+
+# Most Customers the type-ahead search returns for one query
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "20"))
+
+# Seconds that /customers/stats results are reused for the same filters, 0 disables
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "0"))
+
+# Where POST responses are kept for retries with the same Idempotency-Key:
+# "memory" for one process or "database" to share them between workers
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "memory")
+# Seconds a key is remembered and the most keys the memory store holds
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# Seconds a database key stays locked by a request that has not answered yet, so a
+# killed worker's key can be retried; keep it above the gunicorn worker timeout
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+# Days the change feed keeps its entries before flask prune-changes deletes them
+CHANGE_RETENTION_DAYS = int(os.getenv("CHANGE_RETENTION_DAYS", "30"))
+
+# Most SQL statements one request may run before it is reported: an error under
+# test and a warning otherwise, 0 disables
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "0"))
+# SQL statements that take at least this many seconds are logged, 0 disables
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+
+# "text" lines, or "json" records that a background thread writes
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Share of requests whose INFO lines are logged, warnings and errors always are
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+# Share of requests that start a trace, callers can also ask with a traceparent
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# File that sampled traces are appended to as OTLP JSON lines
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# Seconds a readiness check of the database is reused, and the most seconds it may take
+HEALTH_CHECK_TTL = float(os.getenv("HEALTH_CHECK_TTL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
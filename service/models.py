@@ -1,13 +1,28 @@
 """
 Models for Customer
 
-All of the models are stored in this module
+The Customer model and its change feed are stored in this module
 """
 import logging
+from collections import defaultdict
+from datetime import timedelta
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.schema import CreateColumn
+from service.common.cache import LRUCache
+from service.common.normalize import normalize_address
 
 logger = logging.getLogger("flask.app")
 
+# the type-ahead search indexes need the PostgreSQL trigram extension
+TRIGRAM_EXTENSION = "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+TEXT_SEARCH_FIELDS = ("first_name", "last_name", "address")
+
+
 # Create the SQLAlchemy object to be initialized later in init_db()
 db = SQLAlchemy()
 
@@ -18,16 +33,99 @@ def init_db(app):
     Customer.init_db(app)
 
 
+def trigram_available(ddl, target, bind, **kwargs) -> bool:  # pylint: disable=unused-argument
+    """Returns True on PostgreSQL servers that ship the pg_trgm extension
+
+    Used as a DDL condition, so without the extension the trigram indexes
+    are skipped and the search falls back to scanning the table.
+    """
+    if bind is None or bind.dialect.name != "postgresql":
+        return False
+    statement = db.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    return bind.execute(statement).first() is not None
+
+
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
-class Customer(db.Model):
+class ConflictError(Exception):
+    """Used when a Customer was changed by someone else since it was read"""
+
+
+class CustomerChange(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    Class that records a change to a Customer for the change feed
+
+    Every write appends one row per Customer it touches. The row holds no
+    Customer data: the feed joins in the current Customer and a missing one
+    was deleted.
+
+    Ids and transaction ids are both taken before a transaction commits,
+    and transactions commit out of order, so neither alone is a safe cursor.
+    On PostgreSQL each row records its transaction in txid, the feed is read
+    in (txid, id) order, and only rows of transactions older than every one
+    still running are served. Any transaction that commits later has a txid
+    at least that large, so its rows sort after every cursor already handed
+    out. SQLite runs one write transaction at a time, so its txid stays 0
+    and the id alone orders the feed.
+    """
+
+    __tablename__ = "customer_change"
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    customer_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), index=True)
+    txid = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+
+    # the feed pages through (txid, id)
+    __table_args__ = (db.Index("ix_customer_change_txid_id", "txid", "id"),)
+
+    @staticmethod
+    def transaction_id():
+        """Returns the SQL for the id of the writing transaction, 0 where commits are ordered"""
+        if db.engine.dialect.name != "postgresql":
+            return db.literal(0)
+        return db.cast(db.cast(db.func.pg_current_xact_id(), db.Text), db.BigInteger)
+
+    @classmethod
+    def visible(cls):
+        """Returns the condition for rows whose transaction and all before it have finished"""
+        if db.engine.dialect.name != "postgresql":
+            return db.true()
+        oldest_running = db.cast(
+            db.cast(db.func.pg_snapshot_xmin(db.func.pg_current_snapshot()), db.Text), db.BigInteger
+        )
+        return cls.txid < oldest_running
+
+    @classmethod
+    def prune(cls, days: int) -> int:
+        """Deletes the changes older than a number of days and returns how many"""
+        now = db.session.execute(db.select(db.func.now())).scalar()
+        table = cls.__table__
+        result = db.session.execute(
+            table.delete().where(table.c.changed_at < now - timedelta(days=days))
+        )
+        db.session.commit()
+        return result.rowcount
+
+
+class Customer(db.Model):  # pylint: disable=too-many-public-methods
     """
     Class that represents a Customer
     """
 
     app = None
+    cache = LRUCache()
+
+    # the names search() and sort_order() accept, mapped to their columns
+    FIELDS = {
+        "id": "id",
+        "first_name": "first_name",
+        "last_name": "last_name",
+        "address": "address",
+        "active": "status",
+    }
 
     ##################################################
     # Table Schema
@@ -36,9 +134,45 @@ class Customer(db.Model):
     first_name = db.Column(db.String(63), nullable=False)
     last_name = db.Column(db.String(63), nullable=False)
     address = db.Column(db.String(200), nullable=False)
+    # the address normalized by normalize_address(), which address lookups match on
+    address_key = db.Column(db.Text)
     status = db.Column(
         db.Boolean(), nullable=False, default=True
     )  # activated by default, deactivated if False
+    # incremented by every write so clients can tell if a Customer changed
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    # the ORM adds "AND version = :version" to every UPDATE and DELETE it
+    # runs and raises StaleDataError when another writer got there first
+    __mapper_args__ = {"version_id_col": version}
+
+    # the version a client posted as the one it last read, not a column:
+    # update_active() checks it, the ORM never writes it over the counter
+    read_version = None
+
+    # Indexes for each find_by_* access path. The composite name index also
+    # serves last name lookups on its own, so last_name needs no single index.
+    __table_args__ = (
+        db.Index("ix_customer_first_name", "first_name"),
+        db.Index("ix_customer_last_name_first_name", "last_name", "first_name"),
+        db.Index("ix_customer_address_key", "address_key", postgresql_using="hash"),
+        db.Index(
+            "ix_customer_active",
+            "id",
+            postgresql_where=db.text("status = true"),
+            sqlite_where=db.text("status = 1"),
+        ),
+        # trigram indexes serve case-insensitive prefix and substring searches
+        *[
+            db.Index(
+                f"ix_customer_{name}_trgm",
+                name,
+                postgresql_using="gin",
+                postgresql_ops={name: "gin_trgm_ops"},
+            ).ddl_if(callable_=trigram_available)
+            for name in TEXT_SEARCH_FIELDS
+        ],
+    )
 
     ##################################################
     # Instance Methods
@@ -55,7 +189,14 @@ class Customer(db.Model):
         # id must be none to generate next primary key
         self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
+        db.session.flush()
+        self.log_changes([self.id])
+        # the row holds exactly what was just inserted, so keep it loaded
+        # instead of letting the commit expire it and reading it back
+        values = {attr.key: getattr(self, attr.key) for attr in self.__mapper__.column_attrs}
         db.session.commit()
+        for key, value in values.items():
+            set_committed_value(self, key, value)
 
     def update(self):
         """
@@ -64,22 +205,51 @@ class Customer(db.Model):
         logger.info("Saving %s %s", self.first_name, self.last_name)
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
-        db.session.commit()
+        self._commit_versioned()
+        self.cache.delete(self.id)
 
     def delete(self):
         """Removes a Customer from the data store"""
         logger.info("Deleting %s %s", self.first_name, self.last_name)
+        customer_id = self.id
         db.session.delete(self)
-        db.session.commit()
+        self._commit_versioned()
+        self.cache.delete(customer_id)
+
+    def _commit_versioned(self):
+        """Commits the session, raising ConflictError if this Customer is stale"""
+        customer_id = self.id
+        try:
+            db.session.flush()
+            self.log_changes([customer_id])
+            db.session.commit()
+        except StaleDataError as error:
+            db.session.rollback()
+            self.cache.delete(customer_id)
+            raise ConflictError(
+                f"Customer with id '{customer_id}' was changed by another request."
+            ) from error
+
+    @validates("address")
+    def _set_address_key(self, _, address):
+        """Keeps the normalized address key in step with every new address"""
+        self.address_key = normalize_address(address) if isinstance(address, str) else None
+        return address
 
     def serialize(self) -> dict:
         """Serializes a Customer into a dictionary"""
+        return self.serialize_row(self)
+
+    @staticmethod
+    def serialize_row(row) -> dict:
+        """Serializes anything with the Customer columns, like a result row"""
         return {
-            "id": self.id,
-            "first_name": self.first_name,
-            "last_name": self.last_name,
-            "address": self.address,
-            "active": self.status,
+            "id": row.id,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "address": row.address,
+            "active": row.status,
+            "version": row.version,
         }
 
     def deserialize(self, data: dict):
@@ -91,6 +261,11 @@ class Customer(db.Model):
         try:
             self.first_name = data["first_name"]
             self.last_name = data["last_name"]
+            if not isinstance(data["address"], str):
+                raise DataValidationError(
+                    "Invalid type for string [address]: " + str(type(data["address"]))
+                )
+            # setting the address also sets its normalized address_key
             self.address = data["address"]
             if isinstance(data["active"], bool):
                 self.status = data["active"]
@@ -98,6 +273,15 @@ class Customer(db.Model):
                 raise DataValidationError(
                     "Invalid type for boolean [active]: " + str(type(data["active"]))
                 )
+            # an optional version is the one the client last read
+            version = data.get("version")
+            if version is not None and (
+                not isinstance(version, int) or isinstance(version, bool)
+            ):
+                raise DataValidationError(
+                    "Invalid type for integer [version]: " + str(type(version))
+                )
+            self.read_version = version
         except KeyError as error:
             raise DataValidationError(
                 "Invalid customer: missing " + error.args[0]
@@ -109,10 +293,47 @@ class Customer(db.Model):
             ) from error
         return self
 
+    def update_active(self, customer_id: int, versions: list = None) -> dict:
+        """
+        Saves this Customer's fields over the active Customer with customer_id
+
+        A single UPDATE ... RETURNING statement both changes the row and reads
+        it back, so the Customer is never loaded first.
+
+        Args:
+            customer_id (int): the id of the Customer to update
+            versions (list): only update the Customer if it is at one of these versions
+
+        Returns:
+            the serialized updated Customer or None if no active Customer has
+            that id and version
+        """
+        logger.info("Saving %s %s as id %s", self.first_name, self.last_name, customer_id)
+        table = self.__table__
+        where = (table.c.id == customer_id, table.c.status.is_(True))
+        if versions is not None:
+            where += (table.c.version.in_(versions),)
+        return self._update_returning(
+            where,
+            {
+                "first_name": self.first_name,
+                "last_name": self.last_name,
+                "address": self.address,
+                "address_key": self.address_key,
+                "status": self.status,
+            },
+        )
+
     def deactivate(self):
         """set the status to false to deactive account"""
 
         self.status = False
+        self.update()
+
+    def restore(self):
+        """set the status to true to restore a deactivated account"""
+        self.status = True
+        self.update()
 
     ##################################################
     # Class Methods
@@ -122,23 +343,485 @@ class Customer(db.Model):
         """Initializes the database session"""
         logger.info("Initializing database")
         cls.app = app
+        cls.cache = LRUCache(
+            app.config["CUSTOMER_CACHE_SIZE"], app.config["CUSTOMER_CACHE_TTL"]
+        )
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
         app.app_context().push()
         db.create_all()  # make our sqlalchemy tables
 
+    @classmethod
+    def set_status(cls, query, active: bool) -> int:
+        """Activates or deactivates every Customer a query matches
+
+        Runs a single UPDATE statement without loading any Customers
+
+        Returns:
+            the number of Customers that matched
+        """
+        logger.info("Setting status of matching Customers to %s", active)
+        cls.log_query_changes(query)
+        count = query.update(
+            {cls.status: active, cls.version: cls.version + 1}, synchronize_session=False
+        )
+        db.session.commit()
+        cls.cache.clear()
+        return count
+
+    @classmethod
+    def remove(cls, query) -> int:
+        """Deletes every Customer a query matches in a single DELETE statement
+
+        Returns:
+            the number of Customers deleted
+        """
+        logger.info("Deleting matching Customers")
+        cls.log_query_changes(query)
+        count = query.delete(synchronize_session=False)
+        db.session.commit()
+        cls.cache.clear()
+        return count
+
+    @classmethod
+    def set_status_by_id(cls, customer_id: int, active: bool) -> dict:
+        """Activates or deactivates one Customer in a single UPDATE ... RETURNING
+
+        Returns:
+            the serialized Customer or None if there is no Customer with that id
+        """
+        logger.info("Setting status of id %s to %s", customer_id, active)
+        return cls._update_returning(
+            (cls.__table__.c.id == customer_id,), {"status": active}
+        )
+
+    @classmethod
+    def delete_by_id(cls, customer_id: int) -> bool:
+        """Deletes one Customer in a single DELETE ... RETURNING statement
+
+        Returns:
+            True if a Customer was deleted, False if there was none with that id
+        """
+        logger.info("Deleting id %s", customer_id)
+        table = cls.__table__
+        statement = table.delete().where(table.c.id == customer_id).returning(table.c.id)
+        deleted = db.session.execute(statement).first() is not None
+        if deleted:
+            cls.log_changes([customer_id])
+        db.session.commit()
+        cls.cache.delete(customer_id)
+        return deleted
+
+    @classmethod
+    def _update_returning(cls, where: tuple, values: dict) -> dict:
+        """Runs one UPDATE ... RETURNING and refreshes the cache with the row"""
+        table = cls.__table__
+        statement = (
+            table.update()
+            .where(*where)
+            .values(version=table.c.version + 1, **values)
+            .returning(table)
+        )
+        row = db.session.execute(statement).first()
+        if row is not None:
+            cls.log_changes([row.id])
+        db.session.commit()
+        if row is None:
+            return None
+        data = cls.serialize_row(row)
+        cls.cache.set(row.id, data)
+        return data
+
+    @staticmethod
+    def log_changes(customer_ids: list):
+        """Appends the Customer ids to the change feed in the current transaction"""
+        if customer_ids:
+            db.session.execute(
+                CustomerChange.__table__.insert().values(txid=CustomerChange.transaction_id()),
+                [{"customer_id": customer_id} for customer_id in customer_ids],
+            )
+
+    @classmethod
+    def log_query_changes(cls, query):
+        """Appends every Customer a query matches to the change feed in one INSERT ... SELECT"""
+        statement = CustomerChange.__table__.insert().from_select(
+            ["customer_id", "txid"], query.with_entities(cls.id, CustomerChange.transaction_id()).statement
+        )
+        db.session.execute(statement)
+
+    @classmethod
+    def changes(cls, after: tuple, limit: int) -> list:
+        """Returns the changes to Customers after a cursor, oldest first
+
+        Each row has the "txid" and "change_id" that make up its cursor, the
+        Customer "id" and the current Customer columns, which are all None if
+        the Customer was deleted.
+
+        Args:
+            after (tuple): only return changes after this (txid, change_id) cursor
+            limit (int): the maximum number of changes to return
+        """
+        logger.info("Processing %s changes after cursor %s ...", limit, after)
+        change = CustomerChange.__table__
+        table = cls.__table__
+        statement = (
+            db.select(
+                change.c.txid,
+                change.c.id.label("change_id"),
+                change.c.customer_id.label("id"),
+                *[column for column in table.columns if column.name != "id"],
+            )
+            .select_from(change.outerjoin(table, table.c.id == change.c.customer_id))
+            .where(db.tuple_(change.c.txid, change.c.id) > tuple(after), CustomerChange.visible())
+            .order_by(change.c.txid, change.c.id)
+            .limit(limit)
+        )
+        return db.session.execute(statement).all()
+
+    @classmethod
+    def upgrade_schema(cls):
+        """Adds any tables, columns and indexes missing from an existing database
+
+        Address keys are filled in for Customers saved before they existed
+        """
+        logger.info("Upgrading database schema")
+        # new tables of every model, including those kept outside this module
+        db.create_all()
+        if trigram_available(None, None, db.session.connection()):
+            db.session.execute(db.text(TRIGRAM_EXTENSION))
+            db.session.commit()
+        tables = db.metadata.sorted_tables
+        for table in tables:
+            existing = {column["name"] for column in db.inspect(db.engine).get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    logger.info("Adding column %s.%s", table.name, column.name)
+                    ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    db.session.execute(db.text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+        db.session.commit()
+        cls._fill_address_keys()
+        # CREATE INDEX CONCURRENTLY cannot run in a transaction, and it waits
+        # for every open transaction on the table, this session's included
+        db.session.commit()
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table in tables:
+                for index in table.indexes:
+                    cls._create_index(conn, index)
+
+    @staticmethod
+    def _create_index(conn, index):
+        """Builds an index if it is missing, on PostgreSQL without blocking writes
+
+        A concurrent build that failed leaves an invalid index behind, which
+        is dropped first so that it gets built again.
+        """
+        if conn.dialect.name != "postgresql":
+            index.create(bind=conn, checkfirst=True)
+            return
+        invalid = db.text(
+            "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+        )
+        if conn.execute(invalid, {"name": index.name}).first() is not None:
+            logger.info("Dropping invalid index %s", index.name)
+            conn.execute(db.text(f"DROP INDEX CONCURRENTLY {index.name}"))
+        options = index.dialect_options["postgresql"]
+        options["concurrently"] = True
+        try:
+            index.create(bind=conn, checkfirst=True)
+        finally:
+            options["concurrently"] = False
+
+    @classmethod
+    def _fill_address_keys(cls, batch_size: int = 1000):
+        """Sets the address_key of every Customer that has none, a batch at a time"""
+        table = cls.__table__
+        select = db.select(table.c.id, table.c.address).where(table.c.address_key.is_(None))
+        update = (
+            table.update()
+            .where(table.c.id == db.bindparam("customer_id"))
+            .values(address_key=db.bindparam("key"))
+        )
+        rows = db.session.execute(select.limit(batch_size)).all()
+        while rows:
+            logger.info("Filling %s address keys", len(rows))
+            db.session.execute(
+                update,
+                [{"customer_id": row.id, "key": normalize_address(row.address)} for row in rows],
+            )
+            db.session.commit()
+            rows = db.session.execute(select.limit(batch_size)).all()
+
+    @classmethod
+    def create_many(cls, records, batch_size: int, atomic: bool = False) -> dict:
+        """Creates Customers from dictionaries in batches
+
+        Each batch is inserted with one multi-row INSERT and committed on its
+        own, so an invalid record only costs its own slot in the result. In
+        atomic mode every batch shares one transaction and the first error
+        rolls all of them back.
+
+        Args:
+            records: an iterable of Customer dictionaries. A DataValidationError
+                in place of a dictionary is reported as that record's error.
+            batch_size (int): the number of Customers inserted at a time
+            atomic (bool): create all of the Customers or none of them
+
+        Returns:
+            a dictionary with the new "ids" in record order (None where a
+            record failed) and the "errors" with the index of each failed record
+        """
+        logger.info("Creating Customers in batches of %s ...", batch_size)
+        result = {"ids": [], "errors": []}
+        batch = []
+        for index, record in enumerate(records):
+            result["ids"].append(None)
+            try:
+                if isinstance(record, DataValidationError):
+                    raise record
+                batch.append((index, cls().deserialize(record)))
+            except DataValidationError as error:
+                result["errors"].append({"index": index, "message": str(error)})
+                if atomic:
+                    db.session.rollback()
+                    result["ids"] = [None] * len(result["ids"])
+                    return result
+            if len(batch) >= batch_size:
+                cls._insert_batch(batch, result, atomic)
+        cls._insert_batch(batch, result, atomic)
+        if atomic:
+            db.session.commit()
+        result["errors"].sort(key=lambda error: error["index"])
+        return result
+
+    @classmethod
+    def _insert_batch(cls, batch: list, result: dict, atomic: bool):
+        """Inserts a batch of (index, Customer) pairs and records their ids"""
+        if batch:
+            try:
+                db.session.add_all([customer for _, customer in batch])
+                db.session.flush()
+                for index, customer in batch:
+                    result["ids"][index] = customer.id
+                cls.log_changes([customer.id for _, customer in batch])
+                if not atomic:
+                    db.session.commit()
+            except DBAPIError as error:
+                db.session.rollback()
+                if atomic:
+                    raise DataValidationError(
+                        f"Bulk create rolled back: {str(error.orig).strip()}"
+                    ) from error
+                # find the bad records by inserting the batch one at a time
+                cls._insert_each(batch, result)
+            batch.clear()
+
+    @classmethod
+    def _insert_each(cls, batch: list, result: dict):
+        """Inserts (index, Customer) pairs one per commit, recording errors"""
+        for index, customer in batch:
+            try:
+                customer.id = None
+                db.session.add(customer)
+                db.session.flush()
+                result["ids"][index] = customer.id
+                cls.log_changes([customer.id])
+                db.session.commit()
+            except DBAPIError as error:
+                db.session.rollback()
+                result["ids"][index] = None
+                message = str(error.orig).strip()
+                result["errors"].append({"index": index, "message": message})
+
     @classmethod
     def all(cls):
         """Returns all of the Customers in the database"""
         logger.info("Processing all Customers")
         return cls.query.all()
 
+    @classmethod
+    def paginate(cls, query, limit: int, after: int = None, sort: list = None) -> list:
+        """Returns one page of a Customer query using keyset pagination
+
+        The page holds plain rows with the Customer columns rather than
+        Customer objects, which are much cheaper to build and serialize.
+
+        Args:
+            query: the Customer query to page through
+            limit (int): the maximum number of Customers to return
+            after (int): only return Customers that sort after the one with this id
+            sort (list): field names to order by, see sort_order()
+        """
+        logger.info("Processing page of %s after id %s ...", limit, after)
+        query = cls._keyset(query, after, sort)
+        return query.with_entities(*cls.__table__.columns).limit(limit).all()
+
+    @classmethod
+    def stream(  # pylint: disable=too-many-arguments
+        cls, query, batch_size: int, after: int = None, limit: int = None, sort: list = None
+    ):
+        """Returns an iterable over the rows of a Customer query that does not load them all at once
+
+        Rows are read through a server-side cursor batch_size at a time so
+        memory stays bounded no matter how many Customers match. The query
+        is built right away, so a bad sort fails before any row is read.
+
+        Args:
+            query: the Customer query to stream
+            batch_size (int): the number of rows fetched per round trip
+            after (int): only yield Customers that sort after the one with this id
+            limit (int): the maximum number of Customers to yield
+            sort (list): field names to order by, see sort_order()
+        """
+        logger.info("Streaming Customers after id %s ...", after)
+        query = cls._keyset(query, after, sort)
+        return query.with_entities(*cls.__table__.columns).limit(limit).yield_per(batch_size)
+
+    @classmethod
+    def count_by_status(cls, query, by_initial: bool = False) -> dict:
+        """Counts the Customers a query matches with one GROUP BY, without loading them
+
+        Args:
+            query: the Customer query to count
+            by_initial (bool): also count by the first letter of the last name
+
+        Returns:
+            the "total", "active" and "inactive" counts, and with by_initial
+            the same counts for each initial under "by_last_name_initial"
+        """
+        logger.info("Counting Customers by status ...")
+        columns = [cls.status]
+        if by_initial:
+            columns.append(db.func.upper(db.func.substr(cls.last_name, 1, 1)).label("initial"))
+        rows = query.with_entities(*columns, db.func.count().label("count")).group_by(*columns).all()
+
+        def tally():
+            return {"total": 0, "active": 0, "inactive": 0}
+
+        counts = tally()
+        initials = defaultdict(tally)
+        for row in rows:
+            for target in [counts, initials[row.initial]] if by_initial else [counts]:
+                target["total"] += row.count
+                target["active" if row.status else "inactive"] += row.count
+        if by_initial:
+            counts["by_last_name_initial"] = dict(sorted(initials.items()))
+        return counts
+
+    @classmethod
+    def sort_order(cls, sort: list = None) -> list:
+        """Returns the (column, descending) pairs for a list of field names
+
+        A name starting with "-" sorts descending. The id is always added
+        last so the order is total and can be paged through.
+
+        Raises:
+            DataValidationError: if a name is not one of the FIELDS
+        """
+        order = []
+        for name in sort or []:
+            descending = name.startswith("-")
+            field = name.lstrip("-")
+            if field not in cls.FIELDS:
+                raise DataValidationError(f"Invalid sort field: {field}")
+            order.append((getattr(cls, cls.FIELDS[field]), descending))
+        if not order or order[-1][0] is not cls.id:
+            order.append((cls.id, False))
+        return order
+
+    @classmethod
+    def _keyset(cls, query, after: int, sort: list):
+        """Orders a query and skips the Customers up to and including the one with id after"""
+        order = cls.sort_order(sort)
+        first, descending = order[0]
+        if after is not None and first is cls.id:
+            # the id alone decides the order, so no anchor row has to be read
+            query = query.filter(cls.id < after if descending else cls.id > after)
+        elif after is not None:
+            anchor = cls.query.with_entities(*[column for column, _ in order]).filter(cls.id == after).first()
+            if anchor is None:
+                # the Customer was deleted, so its place in the sort order is unknown
+                query = query.filter(cls.id > after)
+            else:
+                query = query.filter(cls._sorts_after(order, anchor))
+        return query.order_by(
+            *[column.desc() if descending else column for column, descending in order]
+        )
+
+    @staticmethod
+    def _sorts_after(order: list, anchor) -> object:
+        """Returns the condition for rows that come after the anchor row in the order"""
+        clauses = []
+        for position, (column, descending) in enumerate(order):
+            ties = [earlier == anchor[i] for i, (earlier, _) in enumerate(order[:position])]
+            beyond = column < anchor[position] if descending else column > anchor[position]
+            clauses.append(db.and_(*ties, beyond))
+        return db.or_(*clauses)
+
+    @classmethod
+    def search(cls, **filters):
+        """Returns a query for the Customers that match every given filter
+
+        Args:
+            filters: values keyed by the FIELDS names, plus "ids" for a list
+                of ids. A list matches any of its values, None is ignored.
+
+        Raises:
+            DataValidationError: if a filter is not one of the FIELDS
+        """
+        query = cls.query
+        for name, value in filters.items():
+            if value is None:
+                continue
+            field = "id" if name == "ids" else name
+            if field not in cls.FIELDS:
+                raise DataValidationError(f"Invalid filter: {name}")
+            logger.info("Filtering by %s: %s", name, value)
+            values = list(value) if isinstance(value, (list, tuple)) else [value]
+            column = getattr(cls, cls.FIELDS[field])
+            if field == "address":
+                # addresses match on their normalized key, so spelling variants are found
+                column = cls.address_key
+                values = [normalize_address(address) for address in values]
+            if len(values) == 1:
+                # a single value is compared with = so hash indexes can be used
+                query = query.filter(column == values[0])
+            else:
+                query = query.filter(column.in_(values))
+        return query
+
     @classmethod
     def find(cls, by_id):
         """Finds a Customer by its ID"""
         logger.info("Processing lookup for id %s ...", by_id)
         return cls.query.get(by_id)
 
+    @classmethod
+    def find_active_many(cls, ids: list) -> list:
+        """Returns the rows of the active Customers with any of the ids in one query
+
+        Args:
+            ids (list): the ids to look up, in any order
+        """
+        logger.info("Processing lookup for %s ids ...", len(ids))
+        query = cls.query.filter(cls.id.in_(ids), cls.status.is_(True))
+        return query.with_entities(*cls.__table__.columns).all()
+
+    @classmethod
+    def find_serialized(cls, by_id) -> dict:
+        """Finds a serialized Customer by its ID, going through the cache
+
+        The returned dictionary is shared with the cache and must not be changed
+        """
+        data = cls.cache.get(by_id)
+        if data is None:
+            customer = cls.find(by_id)
+            if customer is None:
+                return None
+            data = customer.serialize()
+            cls.cache.set(by_id, data)
+        return data
+
     @classmethod
     def find_by_first_name(cls, first_name: str) -> list:
         """Returns all Customers with the first name
@@ -151,7 +834,7 @@ class Customer(db.Model):
 
         """
         logger.info("Processing first name query for %s ...", first_name)
-        return cls.query.filter(cls.first_name == first_name)
+        return cls.search(first_name=first_name)
 
     @classmethod
     def find_by_last_name(cls, last_name: str) -> list:
@@ -165,11 +848,56 @@ class Customer(db.Model):
 
         """
         logger.info("Processing last name query for %s ...", last_name)
-        return cls.query.filter(cls.last_name == last_name)
+        return cls.search(last_name=last_name)
 
     # @classmethod
     # def find_by_address(cls, address:str) -> list:
 
+    @classmethod
+    def find_by_text(cls, text: str, prefix: bool = False):
+        """Returns the Customers whose name or address contains the text, ignoring case
+
+        Text shorter than three characters only matches at the start of a
+        field, because the trigram indexes cannot serve shorter substrings.
+
+        Args:
+            text (string): what the user typed so far
+            prefix (bool): only match at the start of a field
+        """
+        logger.info("Processing text search for %s ...", text)
+        escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"{escaped}%" if prefix or len(text) < 3 else f"%{escaped}%"
+        return cls.query.filter(
+            db.or_(
+                *[getattr(cls, name).ilike(pattern, escape="\\") for name in TEXT_SEARCH_FIELDS]
+            )
+        )
+
+    @classmethod
+    def search_text(cls, text: str, limit: int) -> list:
+        """Returns the rows of up to limit Customers matching the text, prefix matches first
+
+        The Customers with a field starting with the text are fetched first
+        and substring matches fill the rest of the page. A LIMIT without an
+        ORDER BY would cut the matches at random, and ranking every match
+        before the LIMIT would sort them all on each keystroke.
+
+        Args:
+            text (string): what the user typed so far
+            limit (int): the most rows to return
+        """
+        columns = cls.__table__.columns
+        rows = cls.find_by_text(text, prefix=True).with_entities(*columns).limit(limit).all()
+        if len(rows) < limit and len(text) >= 3:
+            rows += (
+                cls.find_by_text(text)
+                .filter(cls.id.notin_([row.id for row in rows]))
+                .with_entities(*columns)
+                .limit(limit - len(rows))
+                .all()
+            )
+        return rows
+
     @classmethod
     def find_by_name(cls, first_name: str, last_name: str) -> list:
         """Returns all Customers with the given name
@@ -178,9 +906,7 @@ class Customer(db.Model):
             name (string): the name of the Customers you want to match
         """
         logger.info("Processing name query for %s %s ...", first_name, last_name)
-        return cls.query.filter(
-            cls.first_name == first_name, cls.last_name == last_name
-        )
+        return cls.search(first_name=first_name, last_name=last_name)
 
     @classmethod
     def find_by_address(cls, address: str) -> list:
@@ -190,4 +916,12 @@ class Customer(db.Model):
             address (string): the address of the Customers
         """
         logger.info("Processing address query for %s ...", address)
-        return cls.query.filter(cls.address == address)
+        return cls.search(address=address)
+
+
+# the trigram extension must exist before the indexes that use it
+event.listen(
+    Customer.__table__,
+    "before_create",
+    DDL(TRIGRAM_EXTENSION).execute_if(callable_=trigram_available),
+)
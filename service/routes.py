@@ -3,11 +3,17 @@ My Service
 
 Describe what your service does here
 """
-
-from flask import jsonify, abort
+import hashlib
+from flask import jsonify, abort, request, Response, stream_with_context
 from flask_restx import Resource, fields, reqparse, inputs
 from service.common import status  # HTTP Status Codes
-from service.models import Customer
+from service.common.cache import LRUCache
+from service.common.compression import ENCODING_SUFFIXES
+from service.common.health import DatabaseCheck, pool_status
+from service.common.idempotency import StoredResponse, init_store
+from service.common.tracing import span
+from service.common.serializers import ModelSerializer, MEDIA_TYPES, JSON, dumps, encode, decode
+from service.models import db, Customer, DataValidationError, ConflictError
 from . import app, api
 
 
@@ -25,12 +31,41 @@ def index():
 ######################################################################
 # check service health
 ######################################################################
+# pings of the database for the readiness probe, shared by every probe
+database_check = DatabaseCheck(app.config["HEALTH_CHECK_TTL"], app.config["HEALTH_CHECK_TIMEOUT"])
+
+
 @app.route("/health")
+@app.route("/health/live")
 def health():
-    """Health Status"""
+    """Health Status, the process is up and serving without asking the database"""
     return jsonify({"status": "OK"}), status.HTTP_200_OK
 
 
+@app.route("/health/ready")
+def readiness():
+    """Readiness Status, the database answers through the connection pool"""
+    database = database_check.check(db.engine)
+    ready = database["status"] == "up"
+    return (
+        jsonify(
+            status="OK" if ready else "Unavailable",
+            database=database,
+            pool=pool_status(db.engine.pool),
+        ),
+        status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+######################################################################
+# report the customer cache counters
+######################################################################
+@app.route("/cache/stats")
+def cache_stats():
+    """Customer Cache Statistics"""
+    return jsonify(Customer.cache.stats()), status.HTTP_200_OK
+
+
 # Define the model so that the docs reflect what can be sent
 create_model = api.model(
     "Customer",
@@ -58,14 +93,67 @@ customer_model = api.inherit(
         "id": fields.String(
             readOnly=True, description="The unique id assigned internally by service"
         ),
+        "version": fields.Integer(
+            description="Goes up on every change, send it back to only update an unchanged Customer"
+        ),
+    },
+)
+
+# turns Customer rows into customer_model dictionaries without marshal()
+customer_serializer = ModelSerializer(customer_model, {"active": "status"})
+
+lookup_model = api.model(
+    "CustomerLookup",
+    {
+        "customers": fields.List(
+            fields.Nested(customer_model), description="The Customers found, in request order"
+        ),
+        "missing": fields.List(
+            fields.String, description="The ids with no active Customer"
+        ),
+    },
+)
+
+
+def id_list(value: str) -> list:
+    """Parses a comma separated list of Customer ids"""
+    try:
+        return [int(customer_id) for customer_id in value.split(",")]
+    except ValueError as error:
+        raise ValueError("ids must be a comma separated list of integers") from error
+
+
+def name_list(value: str) -> list:
+    """Parses a comma separated list of field names"""
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+status_count_model = api.model(
+    "StatusCount",
+    {
+        "total": fields.Integer(description="The number of Customers"),
+        "active": fields.Integer(description="The number of active Customers"),
+        "inactive": fields.Integer(description="The number of deactivated Customers"),
+    },
+)
+
+stats_model = api.inherit(
+    "CustomerStats",
+    status_count_model,
+    {
+        "by_last_name_initial": fields.Wildcard(
+            fields.Nested(status_count_model),
+            description="The counts for each last name initial, with by_initial=true",
+        ),
     },
 )
 
-# query string arguments
+# query string arguments, repeat a filter to match any of its values
 customer_args = reqparse.RequestParser()
 customer_args.add_argument(
     "first_name",
     type=str,
+    action="append",
     location="args",
     required=False,
     help="List Customers by first name",
@@ -73,6 +161,7 @@ customer_args.add_argument(
 customer_args.add_argument(
     "last_name",
     type=str,
+    action="append",
     location="args",
     required=False,
     help="List Customers by last name",
@@ -80,6 +169,7 @@ customer_args.add_argument(
 customer_args.add_argument(
     "address",
     type=str,
+    action="append",
     location="args",
     required=False,
     help="List Customers by address",
@@ -91,6 +181,95 @@ customer_args.add_argument(
     required=False,
     help="List Customers by active",
 )
+customer_args.add_argument(
+    "ids",
+    type=id_list,
+    location="args",
+    required=False,
+    help="Comma separated list of Customer ids",
+)
+customer_args.add_argument(
+    "sort",
+    type=name_list,
+    location="args",
+    required=False,
+    help="Comma separated fields to sort by, prefix a field with - to sort descending",
+)
+customer_args.add_argument(
+    "limit",
+    type=inputs.positive,
+    location="args",
+    required=False,
+    help="Maximum number of Customers in a page",
+)
+customer_args.add_argument(
+    "after",
+    type=inputs.natural,
+    location="args",
+    required=False,
+    help="Return the page of Customers after this id",
+)
+customer_args.add_argument(
+    "stream",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    help="Stream every matching Customer as newline delimited JSON",
+)
+
+# filters for operations that change many Customers at once
+bulk_filter_args = customer_args.copy()
+for name in ("sort", "limit", "after", "stream"):
+    bulk_filter_args.remove_argument(name)
+
+# multi-get arguments
+lookup_args = reqparse.RequestParser()
+lookup_args.add_argument(
+    "ids",
+    type=id_list,
+    location="args",
+    required=True,
+    help="Comma separated list of Customer ids",
+)
+
+# statistics arguments, the listing filters and how to group the counts
+stats_args = bulk_filter_args.copy()
+stats_args.add_argument(
+    "by_initial",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    default=False,
+    help="Also count the Customers by the first letter of their last name",
+)
+
+# recent statistics by their filters, reused for STATS_CACHE_TTL seconds
+stats_cache = LRUCache(128 if app.config["STATS_CACHE_TTL"] > 0 else 0, app.config["STATS_CACHE_TTL"])
+
+# responses to POSTs sent with an Idempotency-Key, replayed to retries
+idempotency_store = init_store(app.config)
+# the response headers that are replayed with a stored body
+REPLAYED_HEADERS = ("Content-Type", "Location", "ETag", "Vary")
+
+# type-ahead search arguments
+search_args = reqparse.RequestParser()
+search_args.add_argument(
+    "q",
+    type=inputs.regex(r"\S"),
+    location="args",
+    required=True,
+    help="The start or part of a first name, last name or address",
+)
+search_args.add_argument(
+    "limit",
+    type=inputs.positive,
+    location="args",
+    required=False,
+    help="Maximum number of Customers to return",
+)
+
+NDJSON = "application/x-ndjson"
+
 
 ######################################################################
 #  R E S T   A P I   E N D P O I N T S
@@ -116,8 +295,10 @@ class CustomerResource(Resource):
     # READ A Customer
     # ------------------------------------------------------------------
     @api.doc("get_customers")
+    @api.produces(list(MEDIA_TYPES))
     @api.response(404, "Customer not found")
-    @api.marshal_with(customer_model)
+    @api.response(304, "Customer not modified")
+    @api.response(200, "Success", customer_model)
     def get(self, customer_id):
         """
         Retrieve a single Customer
@@ -125,51 +306,70 @@ class CustomerResource(Resource):
         This endpoint will return a Customer based on it's id
         """
         app.logger.info("Request to Retrieve a customer with id [%s]", customer_id)
-        customer = Customer.find(customer_id)
-        if not customer or not customer.status:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"Customer with id '{customer_id}' was not found.",
-            )
+        customer = find_active_or_404(customer_id)
+        etag = customer_etag(customer)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
         app.logger.info(
-            "Returning customer: %s %s", customer.first_name, customer.last_name
+            "Returning customer: %s %s", customer["first_name"], customer["last_name"]
         )
-        return customer.serialize(), status.HTTP_200_OK
+        return encoded_response(customer_serializer.from_dict(customer), etag=etag)
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING Customer
     # ------------------------------------------------------------------
     @api.doc("update_customers")
+    @api.produces(list(MEDIA_TYPES))
     @api.response(404, "Customer not found")
     @api.response(400, "The posted Customer data was not valid")
+    @api.response(409, "The Customer is no longer at the posted version")
+    @api.response(412, "The Customer does not match If-Match")
     @api.expect(customer_model)
-    @api.marshal_with(customer_model)
+    @api.response(200, "Success", customer_model)
     def put(self, customer_id):
         """
         Update a Customer
 
-        This endpoint will update a Customer based the body that is posted
+        This endpoint will update a Customer based the body that is posted.
+        With an If-Match header or a version in the body it only updates the
+        Customer if it is unchanged.
         """
         app.logger.info("Request to update a customer with id [%s]", customer_id)
-        customer = Customer.find(customer_id)
-        if not customer or not customer.status:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"Customer with id '{customer_id}' was not found.",
-            )
-        app.logger.debug("Payload = %s", api.payload)
-        data = api.payload
-        customer.deserialize(data)
+        payload = request_payload()
+        app.logger.debug("Payload = %s", payload)
+        customer = Customer()
+        try:
+            customer.deserialize(payload)
+        except DataValidationError:
+            # a missing Customer is reported before a bad payload
+            find_active_or_404(customer_id)
+            raise
         if not customer.status:
+            find_active_or_404(customer_id)
             abort(
                 status.HTTP_400_BAD_REQUEST,
                 "Cannot update the status.",
             )
-        customer.id = customer_id
-        customer.update()
+        versions = matched_versions(customer_id)
+        if versions is None and customer.read_version is not None:
+            versions = [customer.read_version]
+        data = customer.update_active(customer_id, versions)
+        if data is None:
+            find_active_or_404(customer_id)
+            if request.if_match:
+                abort(
+                    status.HTTP_412_PRECONDITION_FAILED,
+                    f"Customer with id '{customer_id}' has changed.",
+                )
+            raise ConflictError(
+                f"Customer with id '{customer_id}' is no longer at version {customer.read_version}."
+            )
 
-        app.logger.info("Customer with ID [%s] updated.", customer.id)
-        return customer.serialize(), status.HTTP_200_OK
+        app.logger.info("Customer with ID [%s] updated.", customer_id)
+        return encoded_response(
+            customer_serializer.from_dict(data), etag=customer_etag(data)
+        )
 
     # ------------------------------------------------------------------
     # DELETE A Customer
@@ -183,9 +383,7 @@ class CustomerResource(Resource):
         This endpoint will delete a Customer based the id specified in the path
         """
         app.logger.info("Request to Delete a customer with id [%s]", customer_id)
-        customer = Customer.find(customer_id)
-        if customer:
-            customer.delete()
+        if Customer.delete_by_id(customer_id):
             app.logger.info("Customer with id [%s] was deleted", customer_id)
 
         return "", status.HTTP_204_NO_CONTENT
@@ -203,56 +401,197 @@ class CustomerCollection(Resource):
     # ------------------------------------------------------------------
     @api.doc("list_customers")
     @api.expect(customer_args, validate=True)
-    @api.marshal_list_with(customer_model)
+    @api.response(200, "Success", [customer_model])
+    @api.response(304, "Customers not modified")
+    @api.produces(list(MEDIA_TYPES) + [NDJSON])
     def get(self):
         """Returns all of the Customers"""
         app.logger.info("Request for customer list")
-        customers = []
-        args = customer_args.parse_args()
-        if args["first_name"] and args["last_name"]:
-            app.logger.info(
-                "Filtering by name: %s %s", args["first_name"], args["last_name"]
-            )
-            customers = Customer.find_by_name(args["first_name"], args["last_name"])
-        elif args["first_name"]:
-            app.logger.info("Filtering by first name: %s", args["first_name"])
-            customers = Customer.find_by_first_name(args["first_name"])
-        elif args["last_name"]:
-            app.logger.info("Filtering by last name: %s", args["last_name"])
-            customers = Customer.find_by_last_name(args["last_name"])
-        elif args["address"]:
-            app.logger.info("Filtering by address: %s", args["address"])
-            customers = Customer.find_by_address(args["address"])
-        else:
-            app.logger.info("Returning unfiltered list.")
-            customers = Customer.all()
-
-        results = [customer.serialize() for customer in customers]
-        app.logger.info("[%s] Customers returned", len(results))
-        return results, status.HTTP_200_OK
+        args = parse_args(customer_args)
+        if wants_stream(args):
+            return stream_customers(args)
+        limit = page_size(args)
+        # fetch one extra row to find out if there is a next page
+        customers = Customer.paginate(
+            filtered_query(args), limit + 1, args["after"], args["sort"]
+        )
+        # the extra row is part of the tag because it decides the Link header
+        etag = page_etag(customers)
+        headers = {}
+        if len(customers) > limit:
+            customers = customers[:limit]
+            headers = next_page_link(CustomerCollection, limit, after=customers[-1].id)
+        unchanged = not_modified(etag, headers)
+        if unchanged:
+            return unchanged
+
+        app.logger.info("[%s] Customers returned", len(customers))
+        return encoded_response(
+            [customer_serializer.from_row(row) for row in customers],
+            status.HTTP_200_OK,
+            headers,
+            etag,
+        )
+
+    # ------------------------------------------------------------------
+    # COUNT THE Customers
+    # ------------------------------------------------------------------
+    @api.doc("count_customers")
+    @api.expect(bulk_filter_args, validate=True)
+    @api.response(200, "Success, the count is in the X-Total-Count header")
+    def head(self):
+        """Returns the number of matching Customers in X-Total-Count without listing them"""
+        args = parse_args(bulk_filter_args)
+        total = Customer.count_by_status(filtered_query(args))["total"]
+        return Response(status=status.HTTP_200_OK, headers={"X-Total-Count": str(total)})
 
     # ------------------------------------------------------------------
     # ADD A NEW Customer
     # ------------------------------------------------------------------
-    @api.doc("create_customers")
+    @api.doc(
+        "create_customers",
+        params={"Idempotency-Key": {"in": "header", "description": "Makes retries return the first response"}},
+    )
+    @api.produces(list(MEDIA_TYPES))
     @api.response(400, "The posted data was not valid")
+    @api.response(409, "A request with the same Idempotency-Key is in progress")
+    @api.response(422, "The Idempotency-Key was used for a different request")
     @api.expect(create_model)
-    @api.marshal_with(customer_model, code=201)
+    @api.response(201, "Customer created", customer_model)
     def post(self):
         """
         Creates a Customer
-        This endpoint will create a Customer based the data in the body that is posted
+        This endpoint will create a Customer based the data in the body that is posted.
+        A retry with the same Idempotency-Key header gets the first response back
+        instead of creating the Customer again.
         """
+        return idempotent(self._create)
+
+    def _create(self):
+        """Creates a Customer from the request body"""
         app.logger.info("Request to Create a Customer")
         customer = Customer()
         # app.logger.debug("Payload = %s", api.payload)
-        customer.deserialize(api.payload)
+        customer.deserialize(request_payload())
         customer.create()
         app.logger.info("Customer with new id [%s] created!", customer.id)
         location_url = api.url_for(
             CustomerResource, customer_id=customer.id, _external=True
         )
-        return customer.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
+        data = customer.serialize()
+        return encoded_response(
+            customer_serializer.from_dict(data),
+            status.HTTP_201_CREATED,
+            {"Location": location_url},
+            customer_etag(data),
+        )
+
+
+######################################################################
+#  PATH: /customers/stats
+######################################################################
+@api.route("/customers/stats", strict_slashes=False)
+class CustomerStats(Resource):
+    """Counts Customers without transferring them"""
+
+    # ------------------------------------------------------------------
+    # COUNT Customers BY STATUS
+    # ------------------------------------------------------------------
+    @api.doc("customer_stats")
+    @api.expect(stats_args, validate=True)
+    @api.produces(list(MEDIA_TYPES))
+    @api.response(200, "Success", stats_model)
+    def get(self):
+        """
+        Returns Customer counts by status
+
+        Takes the same filters as the Customer list and counts in the
+        database. With by_initial=true the counts are also broken down by
+        the first letter of the last name.
+        """
+        args = parse_args(stats_args)
+        app.logger.info("Request for customer stats")
+        key = tuple(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in sorted(args.items())
+        )
+        counts = stats_cache.get(key)
+        if counts is None:
+            counts = Customer.count_by_status(filtered_query(args), args["by_initial"])
+            stats_cache.set(key, counts)
+        return encoded_response(counts)
+
+
+######################################################################
+#  PATH: /customers/lookup
+######################################################################
+@api.route("/customers/lookup", strict_slashes=False)
+class CustomerLookup(Resource):
+    """Reads many Customers by id in one request"""
+
+    # ------------------------------------------------------------------
+    # READ MANY Customers
+    # ------------------------------------------------------------------
+    @api.doc("lookup_customers")
+    @api.expect(lookup_args, validate=True)
+    @api.produces(list(MEDIA_TYPES))
+    @api.response(400, "The ids were not valid or too many")
+    @api.response(200, "Success", lookup_model)
+    def get(self):
+        """
+        Retrieve many Customers by id
+
+        Returns the active Customers in the order their ids were asked for,
+        and the ids that have no active Customer, from a single query
+        """
+        ids = list(dict.fromkeys(parse_args(lookup_args)["ids"]))
+        app.logger.info("Request to Retrieve %s customers", len(ids))
+        if len(ids) > app.config["MAX_PAGE_SIZE"]:
+            abort(
+                status.HTTP_400_BAD_REQUEST,
+                f"At most {app.config['MAX_PAGE_SIZE']} ids can be looked up at once.",
+            )
+        found = {row.id: row for row in Customer.find_active_many(ids)}
+        return encoded_response(
+            {
+                "customers": [customer_serializer.from_row(found[i]) for i in ids if i in found],
+                "missing": [str(i) for i in ids if i not in found],
+            }
+        )
+
+
+######################################################################
+#  PATH: /customers/search
+######################################################################
+@api.route("/customers/search", strict_slashes=False)
+class CustomerSearch(Resource):
+    """Finds Customers as the user types"""
+
+    # ------------------------------------------------------------------
+    # SEARCH Customers BY TEXT
+    # ------------------------------------------------------------------
+    @api.doc("search_customers")
+    @api.expect(search_args, validate=True)
+    @api.produces(list(MEDIA_TYPES))
+    @api.response(400, "The search text was missing")
+    @api.response(200, "Success", [customer_model])
+    def get(self):
+        """
+        Search Customers by name or address
+
+        Matches the text anywhere in the first name, last name or address,
+        ignoring case, or only at the start for one or two characters. The
+        Customers whose fields start with the text come first.
+        """
+        args = parse_args(search_args)
+        text = args["q"].strip()
+        app.logger.info("Request to search customers for [%s]", text)
+        max_results = app.config["SEARCH_MAX_RESULTS"]
+        limit = min(args["limit"] or max_results, max_results)
+        # the prefix matches come first from the database, a page this small is ordered here
+        rows = Customer.search_text(text, limit)
+        rows.sort(key=lambda row: search_rank(row, text.lower()))
+        return encoded_response([customer_serializer.from_row(row) for row in rows])
 
 
 ######################################################################
@@ -273,14 +612,8 @@ class DeactivateResource(Resource):
         This endpoint will deactivate a Customer based the id specified in the path
         """
         app.logger.info("Request to deactivate customer with id: %s", customer_id)
-        customer = Customer.find(customer_id)
-        if customer:
-            customer.deactivate()
-        else:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"Customer with id '{customer_id}' was not found.",
-            )
+        if Customer.set_status_by_id(customer_id, False) is None:
+            abort_not_found(customer_id)
 
         app.logger.info("Customer with ID [%s] deactivate complete.", customer_id)
         return "", status.HTTP_200_OK
@@ -303,12 +636,212 @@ class RestoreResource(Resource):
         Restore the account by its ID
         """
         app.logger.info("Request for restoring customer with id: %s", customer_id)
-        customer = Customer.find(customer_id)
-        if not customer:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"Customer with id '{customer_id}' was not found.",
-            )
-        customer.status = True
-        app.logger.info("Customer with ID [%s] restored.", customer.id)
-        return customer.serialize(), status.HTTP_200_OK
+        customer = Customer.set_status_by_id(customer_id, True)
+        if customer is None:
+            abort_not_found(customer_id)
+        app.logger.info("Customer with ID [%s] restored.", customer_id)
+        return customer, status.HTTP_200_OK
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+def negotiated_type() -> str:
+    """Returns the media type the client accepts best, JSON by default"""
+    return request.accept_mimetypes.best_match(list(MEDIA_TYPES), default=JSON)
+
+
+def encoded_response(
+    data, code: int = status.HTTP_200_OK, headers: dict = None, etag: str = None
+):
+    """Returns data encoded in the media type the client accepts best
+
+    JSON is the default; MessagePack and CBOR are used when the Accept header asks
+    """
+    media_type = negotiated_type()
+    with span("encode", {"media_type": media_type}):
+        body = encode(data, media_type)
+    response = Response(body, status=code, headers=headers)
+    response.mimetype = media_type
+    response.vary.add("Accept")
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+def parse_args(parser) -> dict:
+    """Parses the request arguments with a flask-restx parser, in a tracing span"""
+    with span("parse_args"):
+        return parser.parse_args()
+
+
+def entity_tag(*parts) -> str:
+    """Returns a strong ETag for a representation in the negotiated media type"""
+    media_type = negotiated_type()
+    if media_type != JSON:
+        parts += (media_type.rsplit("/", 1)[1],)
+    return "-".join(str(part) for part in parts)
+
+
+def customer_etag(customer: dict) -> str:
+    """Returns the ETag of a serialized Customer from its id and version"""
+    return entity_tag(customer["id"], customer["version"])
+
+
+def page_etag(rows) -> str:
+    """Returns the ETag of a page of Customer rows from their ids and versions"""
+    digest = hashlib.blake2b(digest_size=12)
+    for row in rows:
+        digest.update(f"{row.id}.{row.version},".encode())
+    return entity_tag("page", digest.hexdigest())
+
+
+def not_modified(etag: str, headers: dict = None) -> Response:
+    """Returns a 304 response if If-None-Match has the ETag, otherwise None
+
+    Compressed responses carry the ETag with the encoding appended, so those
+    variants match too and are echoed back as they were sent.
+    """
+    for candidate in [etag] + [f"{etag}-{encoding}" for encoding in ENCODING_SUFFIXES]:
+        if request.if_none_match.contains_weak(candidate):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            response.set_etag(candidate)
+            response.vary.add("Accept")
+            return response
+    return None
+
+
+def matched_versions(customer_id: int) -> list:
+    """Returns the Customer versions allowed by If-Match, or None for any version"""
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    versions = []
+    for etag in request.if_match.as_set():
+        parts = etag.split("-")
+        if len(parts) > 1 and parts[0] == str(customer_id) and parts[1].isdigit():
+            versions.append(int(parts[1]))
+    return versions
+
+
+def idempotent(handler) -> Response:
+    """Runs handler once per Idempotency-Key and replays its response to retries
+
+    A retry that arrives while the first request is still running is
+    rejected with 409 and a key reused for a different request with 422.
+    Errors are not stored, so the request can be retried after them.
+    """
+    key = request.headers.get("Idempotency-Key")
+    if key is None:
+        return handler()
+    if not key or len(key) > 255:
+        abort(status.HTTP_400_BAD_REQUEST, "Idempotency-Key must be 1 to 255 characters")
+    fingerprint = hashlib.sha256(
+        f"{request.method} {request.path} {request.content_type}\n".encode("utf-8") + request.get_data()
+    ).hexdigest()
+    stored = idempotency_store.claim(key, fingerprint)
+    if stored is not None:
+        if stored.status is None:
+            abort(status.HTTP_409_CONFLICT, "A request with this Idempotency-Key is in progress")
+        if stored.fingerprint != fingerprint:
+            abort(status.HTTP_422_UNPROCESSABLE_ENTITY, "Idempotency-Key was used for a different request")
+        app.logger.info("Replaying the response for Idempotency-Key [%s]", key)
+        response = Response(stored.body, status=stored.status, headers=stored.headers)
+        response.headers["Idempotent-Replayed"] = "true"
+        return response
+    try:
+        response = handler()
+    except Exception:
+        idempotency_store.release(key)
+        raise
+    headers = {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers}
+    idempotency_store.save(
+        key, StoredResponse(fingerprint, response.status_code, headers, response.get_data())
+    )
+    return response
+
+
+def request_payload():
+    """Returns the request body decoded from JSON, MessagePack or CBOR"""
+    if request.mimetype != JSON and request.mimetype in MEDIA_TYPES:
+        try:
+            return decode(request.get_data(), request.mimetype)
+        except ValueError as error:
+            raise DataValidationError(
+                f"Invalid {request.mimetype} body: {error}"
+            ) from error
+    return api.payload
+
+
+def abort_not_found(customer_id: int):
+    """Aborts the request with a 404 for the Customer id"""
+    abort(
+        status.HTTP_404_NOT_FOUND,
+        f"Customer with id '{customer_id}' was not found.",
+    )
+
+
+def find_active_or_404(customer_id: int) -> dict:
+    """Returns the serialized active Customer with the id or aborts with a 404"""
+    customer = Customer.find_serialized(customer_id)
+    if not customer or not customer["active"]:
+        abort_not_found(customer_id)
+    return customer
+
+
+def filtered_query(args):
+    """Returns a Customer query that ANDs every filter in the parsed arguments"""
+    return Customer.search(
+        first_name=args["first_name"],
+        last_name=args["last_name"],
+        address=args["address"],
+        active=args["active"],
+        ids=args["ids"],
+    )
+
+
+def page_size(args) -> int:
+    """Returns the requested page size capped at the server maximum"""
+    max_size = app.config["MAX_PAGE_SIZE"]
+    return min(args["limit"] or max_size, max_size)
+
+
+def next_page_link(resource, limit: int, **cursor) -> dict:
+    """Returns a Link header pointing to the page after the cursor"""
+    params = request.args.to_dict(flat=False)
+    params.update(limit=limit, **cursor)
+    url = api.url_for(resource, _external=True, **params)
+    return {"Link": f'<{url}>; rel="next"'}
+
+
+def search_rank(row, text: str) -> tuple:
+    """Returns a sort key that puts rows with a field starting with the text first"""
+    starts = any(
+        value.lower().startswith(text) for value in (row.first_name, row.last_name, row.address)
+    )
+    return (not starts, row.last_name.lower(), row.first_name.lower(), row.id)
+
+
+def wants_stream(args) -> bool:
+    """Returns True if the client asked for a streamed listing"""
+    if args["stream"] is not None:
+        return args["stream"]
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON])
+    return best == NDJSON
+
+
+def stream_customers(args) -> Response:
+    """Streams the matching Customers as one JSON document per line"""
+    app.logger.info("Streaming customer list")
+    customers = Customer.stream(
+        filtered_query(args),
+        app.config["STREAM_BATCH_SIZE"],
+        after=args["after"],
+        limit=args["limit"],
+        sort=args["sort"],
+    )
+
+    def generate():
+        for customer in customers:
+            yield dumps(customer_serializer.from_row(customer)) + b"\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
@@ -0,0 +1,45 @@
+"""
+Benchmark of the Customer list serialization
+
+Compares the original path (Customer objects, serialize(), marshal() and
+the Flask JSON provider) with the path the routes run (column rows, the
+precompiled ModelSerializer and encode()) over the same Customers. Run it with:
+  python -m tests.benchmark_serialization
+"""
+import timeit
+from collections import namedtuple
+from flask_restx import marshal
+from service import app
+from service.common.serializers import JSON, encode
+from service.models import Customer
+from service.routes import customer_model, customer_serializer
+from tests.factories import CustomerFactory
+
+CUSTOMERS = 1000
+REPEAT = 20
+
+Row = namedtuple("Row", Customer.__table__.columns.keys())
+
+
+def main():
+    """Times both serialization paths and prints the speedup"""
+    customers = CustomerFactory.build_batch(CUSTOMERS)
+    rows = [Row(*(getattr(c, name) for name in Row._fields))._replace(version=1) for c in customers]
+
+    def marshal_path():
+        results = [customer.serialize() for customer in customers]
+        return app.json.dumps(marshal(results, customer_model))
+
+    def fast_path():
+        return encode([customer_serializer.from_row(row) for row in rows], JSON)
+
+    with app.app_context():
+        slow = min(timeit.repeat(marshal_path, number=1, repeat=REPEAT))
+        fast = min(timeit.repeat(fast_path, number=1, repeat=REPEAT))
+    print(f"marshal path: {slow * 1000:8.2f} ms per {CUSTOMERS} customers")
+    print(f"fast path:    {fast * 1000:8.2f} ms per {CUSTOMERS} customers")
+    print(f"speedup:      {slow / fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
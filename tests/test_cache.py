@@ -0,0 +1,64 @@
+"""
+Test cases for the LRU Cache
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from service.common.cache import LRUCache
+
+
+class TestLRUCache(TestCase):
+    """Test Cases for LRUCache"""
+
+    def test_get_and_set(self):
+        """It should return what was stored and count hits and misses"""
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get(1))
+        cache.set(1, "one")
+        self.assertEqual(cache.get(1), "one")
+        self.assertEqual(len(cache), 1)
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_evict_least_recently_used(self):
+        """It should evict the least recently used entry when full"""
+        cache = LRUCache(2)
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.get(1)
+        cache.set(3, "three")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), "one")
+        self.assertEqual(cache.get(3), "three")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    @patch("service.common.cache.time.monotonic")
+    def test_expire_entries(self, monotonic_mock):
+        """It should not return entries older than the TTL"""
+        monotonic_mock.return_value = 100.0
+        cache = LRUCache(2, ttl=5)
+        cache.set(1, "one")
+        monotonic_mock.return_value = 104.0
+        self.assertEqual(cache.get(1), "one")
+        monotonic_mock.return_value = 106.0
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_delete_and_clear(self):
+        """It should remove entries when invalidated"""
+        cache = LRUCache(3)
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.delete(1)
+        cache.delete(99)
+        self.assertIsNone(cache.get(1))
+        cache.clear()
+        self.assertIsNone(cache.get(2))
+
+    def test_disabled(self):
+        """It should not store anything when the size is 0"""
+        cache = LRUCache(0)
+        cache.set(1, "one")
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 0)
@@ -2,10 +2,15 @@
 CLI Command Extensions for Flask
 """
 import os
+from collections import namedtuple
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from service.common.cli_commands import (
+    db_create, db_upgrade, prune_changes, compress_static, find_duplicate_customers
+)
+
+Row = namedtuple("Row", ["id", "first_name", "last_name", "address"])
 
 
 class TestFlaskCLI(TestCase):
@@ -21,3 +26,49 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    @patch('service.common.cli_commands.Customer')
+    def test_db_upgrade(self, customer_mock):
+        """It should call the db-upgrade command"""
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_upgrade)
+            self.assertEqual(result.exit_code, 0)
+        customer_mock.upgrade_schema.assert_called_once()
+
+    @patch('service.common.cli_commands.CustomerChange')
+    def test_prune_changes(self, change_mock):
+        """It should call the prune-changes command"""
+        change_mock.prune.return_value = 5
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(prune_changes)
+            self.assertEqual(result.exit_code, 0)
+            result = self.runner.invoke(prune_changes, ["--days", "7"])
+            self.assertEqual(result.exit_code, 0)
+        self.assertIn("Deleted 5 changes older than 7 days", result.output)
+        self.assertEqual([c.args for c in change_mock.prune.call_args_list], [(30,), (7,)])
+
+    @patch('service.common.cli_commands.precompress_static')
+    def test_compress_static(self, precompress_mock):
+        """It should call the compress-static command"""
+        precompress_mock.return_value = 16
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(compress_static)
+            self.assertEqual(result.exit_code, 0)
+        self.assertIn("16", result.output)
+
+    @patch('service.common.cli_commands.Customer')
+    def test_find_duplicates(self, customer_mock):
+        """It should call the find-duplicates command"""
+        rows = [
+            Row(1, "Ann", "Lee", "123 Main Street"),
+            Row(2, "Anne", "Lee", "123 Main St."),
+            Row(3, "Bob", "Stone", "9 Oak Ave"),
+        ]
+        customer_mock.stream.return_value = iter(rows)
+        customer_mock.search.return_value = rows[:2]
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(find_duplicate_customers, ["--threshold", "0.8"])
+            self.assertEqual(result.exit_code, 0)
+        self.assertIn("1: Ann Lee, '123 Main Street'  <->  2: Anne Lee", result.output)
+        self.assertIn("Found 1 likely duplicates", result.output)
+        customer_mock.search.assert_called_once_with(ids=[1, 2])
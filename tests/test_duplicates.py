@@ -0,0 +1,57 @@
+"""
+Test cases for the duplicate Customer detection
+"""
+from unittest import TestCase
+from service.common.duplicates import (
+    Duplicate,
+    blocking_keys,
+    find_duplicates,
+    normalize_record,
+    score_block,
+)
+
+ROWS = [
+    (1, "Ann", "Lee", "123 Main Street"),
+    (2, "Anne", "Lee", "123 Main St."),
+    (3, "Bob", "Stone", "9 Oak Ave"),
+    (4, "Rob", "Stone", "9 Oak Avenue"),
+    (5, "Cy", "Young", "77 Elm Rd"),
+    (6, "Ann", "Lee", "4 Pine Ct"),
+]
+
+
+class TestDuplicates(TestCase):
+    """Test Cases for find_duplicates"""
+
+    def test_blocking_keys(self):
+        """It should block by last name and initial and by house number and street"""
+        record = normalize_record(1, "Ann", "Lee", "123 Main Street, Apt 4")
+        self.assertEqual(blocking_keys(record), ["name:lee a", "address:123 main"])
+        self.assertEqual(blocking_keys(normalize_record(2, "", "", "Main Street")), [])
+
+    def test_score_block(self):
+        """It should score every pair in a block and keep those over the threshold"""
+        block = [normalize_record(*row) for row in ROWS[:2]] + [normalize_record(*ROWS[5])]
+        self.assertEqual([(d.id, d.other_id) for d in score_block(block, 0.85)], [(1, 2)])
+        self.assertEqual(len(score_block(block, 0.0)), 3)
+
+    def test_find_duplicates(self):
+        """It should rank the likely duplicates, most similar first"""
+        duplicates, skipped = find_duplicates(ROWS)
+        self.assertEqual([(d.id, d.other_id) for d in duplicates], [(1, 2), (3, 4)])
+        self.assertGreater(duplicates[0].score, duplicates[1].score)
+        self.assertEqual(skipped, 0)
+
+    def test_find_duplicates_in_processes(self):
+        """It should find the same duplicates with several processes"""
+        self.assertEqual(find_duplicates(ROWS, processes=2), find_duplicates(ROWS))
+
+    def test_skip_oversized_blocks(self):
+        """It should skip blocks too common to be useful"""
+        rows = [(i, "Ann", "Lee", f"{i} Main St") for i in range(5)]
+        duplicates, skipped = find_duplicates(rows, max_block_size=4)
+        self.assertEqual(skipped, 1)
+        self.assertEqual(duplicates, [])
+        duplicates, skipped = find_duplicates(rows, threshold=0.5)
+        self.assertEqual(len(duplicates), 10)
+        self.assertIsInstance(duplicates[0], Duplicate)
@@ -0,0 +1,59 @@
+"""
+Test cases for the database Health check
+"""
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from service.common.health import DatabaseCheck, ping, pool_status
+
+
+class TestHealth(TestCase):
+    """Test Cases for the readiness check"""
+
+    def test_ping(self):
+        """It should report whether the database answers"""
+        self.assertEqual(ping(create_engine("sqlite://"))["status"], "up")
+        result = ping(create_engine("sqlite:////no/such/folder/customers.db"))
+        self.assertEqual(result["status"], "down")
+        self.assertIn("OperationalError", result["error"])
+
+    def test_pool_status(self):
+        """It should report how much of the pool is in use"""
+        engine = create_engine("sqlite:///:memory:", poolclass=QueuePool, pool_size=2)
+        with engine.connect():
+            status = pool_status(engine.pool)
+        self.assertEqual(status, {"size": 2, "checked_out": 1, "overflow": 0, "saturation": 0.5})
+        self.assertEqual(pool_status(object()), {})
+
+    @patch("service.common.health.ping")
+    def test_cached(self, ping_mock):
+        """It should reuse a check until it is older than the ttl"""
+        ping_mock.return_value = {"status": "up"}
+        check = DatabaseCheck(ttl=60, timeout=1)
+        self.assertEqual(check.check(None), {"status": "up"})
+        self.assertEqual(check.check(None), {"status": "up"})
+        self.assertEqual(ping_mock.call_count, 1)
+        check.ttl = 0
+        check.check(None)
+        self.assertEqual(ping_mock.call_count, 2)
+
+    def test_timeout(self):
+        """It should fail fast and never start a second ping while one hangs"""
+        release = threading.Event()
+        calls = []
+
+        def hanging_ping(engine):
+            calls.append(engine)
+            release.wait(5)
+            return {"status": "up"}
+
+        check = DatabaseCheck(ttl=0, timeout=0.05)
+        with patch("service.common.health.ping", hanging_ping):
+            self.assertEqual(check.check("db")["status"], "down")
+            self.assertIn("no answer", check.check("db")["error"])
+            self.assertEqual(len(calls), 1)
+            release.set()
+            check.timeout = 5
+            self.assertEqual(check.check("db"), {"status": "up"})
@@ -0,0 +1,50 @@
+"""
+Test cases for the Idempotency stores
+"""
+from unittest import TestCase
+from service.common.idempotency import StoredResponse, MemoryStore, DatabaseStore, init_store
+
+
+class TestMemoryStore(TestCase):
+    """Test Cases for MemoryStore"""
+
+    def test_claim_once(self):
+        """It should let only the first request claim a key"""
+        store = MemoryStore(10, 60)
+        self.assertIsNone(store.claim("a", "print"))
+        self.assertEqual(store.claim("a", "print"), StoredResponse("print", None, None, None))
+
+    def test_save_and_release(self):
+        """It should return saved responses and forget released keys"""
+        store = MemoryStore(10, 60)
+        store.claim("a", "print")
+        stored = StoredResponse("print", 201, {"Location": "/a"}, b"{}")
+        store.save("a", stored)
+        self.assertEqual(store.claim("a", "print"), stored)
+        store.release("a")
+        self.assertIsNone(store.claim("a", "print"))
+
+    def test_bounded(self):
+        """It should forget the least recently used keys when full"""
+        store = MemoryStore(1, 60)
+        store.claim("a", "print")
+        store.claim("b", "print")
+        self.assertIsNone(store.claim("a", "print"))
+
+
+class TestInitStore(TestCase):
+    """Test Cases for init_store"""
+
+    def test_init_store(self):
+        """It should pick the store from the configuration"""
+        config = {
+            "IDEMPOTENCY_STORE": "memory",
+            "IDEMPOTENCY_KEY_TTL": 60,
+            "IDEMPOTENCY_CACHE_SIZE": 10,
+            "IDEMPOTENCY_LOCK_SECONDS": 30,
+        }
+        self.assertIsInstance(init_store(config), MemoryStore)
+        config["IDEMPOTENCY_STORE"] = "database"
+        store = init_store(config)
+        self.assertIsInstance(store, DatabaseStore)
+        self.assertEqual((store.ttl, store.lease), (60, 30))
@@ -0,0 +1,77 @@
+"""
+Test cases for the Log Handlers
+"""
+import io
+import json
+import logging
+from unittest import TestCase
+from flask import Flask
+from service.common.log_handlers import init_logging, stop_logging
+
+
+def make_app(log_format: str, sample_rate: float = 1.0):
+    """Returns a Flask app that logs through a server logger writing to a buffer"""
+    app = Flask("logging_test")
+    app.config.update(LOG_FORMAT=log_format, LOG_SAMPLE_RATE=sample_rate)
+    stream = io.StringIO()
+    server_logger = logging.getLogger(f"logging_test.{log_format}.{sample_rate}")
+    server_logger.handlers = [logging.StreamHandler(stream)]
+    server_logger.setLevel(logging.INFO)
+    init_logging(app, server_logger.name)
+
+    @app.route("/hello")
+    def hello():
+        app.logger.info("Saying hello")
+        app.logger.warning("Hello is deprecated")
+        return "hello"
+
+    return app, stream
+
+
+class TestLogHandlers(TestCase):
+    """Test Cases for the logging setup"""
+
+    def test_json_logging(self):
+        """It should write JSON records with the request id from a background thread"""
+        app, stream = make_app("json")
+        response = app.test_client().get("/hello", headers={"X-Request-ID": "abc123"})
+        self.assertEqual(response.headers["X-Request-ID"], "abc123")
+        stop_logging(app)
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        messages = [record["message"] for record in records]
+        self.assertEqual(messages, ["Logging handler established", "Saying hello", "Hello is deprecated", "GET /hello 200"])
+        self.assertNotIn("request_id", records[0])
+        self.assertEqual({record["request_id"] for record in records[1:]}, {"abc123"})
+        self.assertEqual(records[2]["level"], "WARNING")
+        self.assertEqual(records[3]["status"], 200)
+        self.assertGreaterEqual(records[3]["duration_ms"], 0)
+
+    def test_request_id(self):
+        """It should make up a request id when the client sends none"""
+        app, _ = make_app("text")
+        response = app.test_client().get("/hello")
+        self.assertEqual(len(response.headers["X-Request-ID"]), 32)
+        self.assertIsNone(app.extensions.get("log_listener"))
+
+    def test_sampling(self):
+        """It should drop the INFO lines of unsampled requests but keep warnings"""
+        app, stream = make_app("json", sample_rate=0.0)
+        app.test_client().get("/hello")
+        stop_logging(app)
+        messages = [json.loads(line)["message"] for line in stream.getvalue().splitlines()]
+        self.assertEqual(messages, ["Logging handler established", "Hello is deprecated"])
+
+    def test_json_exception(self):
+        """It should keep the traceback of an exception out of the queued message"""
+        app, stream = make_app("json")
+        with app.test_request_context("/hello"):
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                app.logger.exception("Failed %s", "here")
+        stop_logging(app)
+        record = json.loads(stream.getvalue().splitlines()[-1])
+        self.assertEqual(record["message"], "Failed here")
+        self.assertIn("Traceback", record["exception"])
+        self.assertIn("ValueError: boom", record["exception"])
+        self.assertEqual(record["level"], "ERROR")
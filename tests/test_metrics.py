@@ -0,0 +1,52 @@
+"""
+Test cases for the Prometheus metrics
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from prometheus_client import REGISTRY
+from sqlalchemy.pool import QueuePool
+from service import app
+from service.common.metrics import metrics, watch_pool
+
+
+class TestMetrics(TestCase):
+    """Test Cases for the metrics collection"""
+
+    def test_multiprocess(self):
+        """It should add up the samples that gunicorn workers wrote"""
+        with tempfile.TemporaryDirectory() as folder:
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": folder}):
+                with app.test_request_context("/metrics"):
+                    response = metrics()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+
+    def test_watch_pool(self):
+        """It should track connections in use and beyond the pool size"""
+        pool = QueuePool(lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=2)
+        watch_pool(pool)
+        first = pool.connect()
+        second = pool.connect()
+        self.assertEqual(REGISTRY.get_sample_value("db_pool_checked_out"), 2)
+        self.assertEqual(REGISTRY.get_sample_value("db_pool_overflow"), 1)
+        second.close()
+        first.close()
+        self.assertEqual(REGISTRY.get_sample_value("db_pool_checked_out"), 0)
+        self.assertEqual(REGISTRY.get_sample_value("db_pool_overflow"), 0)
+
+    def test_import_without_folder(self):
+        """It should create a missing PROMETHEUS_MULTIPROC_DIR on import"""
+        with tempfile.TemporaryDirectory() as parent:
+            folder = os.path.join(parent, "prometheus")
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=folder)
+            result = subprocess.run(
+                [sys.executable, "-c", "import service.common.metrics"],
+                env=env, capture_output=True, text=True, check=False
+            )
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertTrue(os.path.isdir(folder))
@@ -5,8 +5,15 @@ Test cases for Customer Model
 import os
 import logging
 import unittest
+from datetime import timedelta
+from unittest.mock import patch
 
-from service.models import Customer, DataValidationError, db
+from service.models import (
+    Customer, CustomerChange, DataValidationError, ConflictError, db, trigram_available
+)
+from service.common.idempotency import IdempotencyKey
+from service.common.query_log import QueryLog, count_queries
+from service.common.cache import LRUCache
 from service import app
 from tests.factories import CustomerFactory
 
@@ -43,11 +50,14 @@ class TestCustomer(unittest.TestCase):
     def setUp(self):
         """This runs before each test"""
         db.session.query(Customer).delete()  # clean up the last tests
+        db.session.query(CustomerChange).delete()
+        db.session.query(IdempotencyKey).delete()
         db.session.commit()
 
     def tearDown(self):
         """This runs after each test"""
         db.session.remove()
+        Customer.cache = LRUCache()
 
     ######################################################################
     #  T E S T   C A S E S
@@ -122,6 +132,119 @@ class TestCustomer(unittest.TestCase):
         self.assertEqual(customers[0].id, original_id)
         self.assertEqual(customers[0].first_name, "Joshua")
 
+    def test_update_active(self):
+        """It should Update an active Customer in one statement"""
+        customer = CustomerFactory()
+        customer.create()
+        changes = Customer(
+            first_name="Joshua", last_name="Williams", address="1 Main St", status=True
+        )
+        data = changes.update_active(customer.id)
+        self.assertEqual(data["id"], customer.id)
+        self.assertEqual(data["first_name"], "Joshua")
+        self.assertEqual(data["address"], "1 Main St")
+        db.session.remove()
+        self.assertEqual(Customer.find(customer.id).last_name, "Williams")
+
+    def test_update_active_not_found(self):
+        """It should not Update a missing or deactivated Customer"""
+        customer = CustomerFactory(status=False)
+        customer.create()
+        self.assertIsNone(CustomerFactory().update_active(customer.id))
+        self.assertIsNone(CustomerFactory().update_active(0))
+
+    def test_update_active_if_version(self):
+        """It should only Update a Customer that is at one of the given versions"""
+        customer = CustomerFactory()
+        customer.create()
+        self.assertIsNone(CustomerFactory().update_active(customer.id, [2]))
+        self.assertIsNone(CustomerFactory().update_active(customer.id, []))
+        data = CustomerFactory(status=True).update_active(customer.id, [1, 3])
+        self.assertEqual(data["version"], 2)
+
+    def test_writes_increment_version(self):
+        """It should increment the version of a Customer on every write"""
+        customer = CustomerFactory(status=True)
+        customer.create()
+        self.assertEqual(customer.version, 1)
+        self.assertEqual(CustomerFactory(status=True).update_active(customer.id)["version"], 2)
+        self.assertEqual(Customer.set_status_by_id(customer.id, False)["version"], 3)
+        Customer.set_status(Customer.query.filter(Customer.id == customer.id), True)
+        customer = Customer.find(customer.id)
+        self.assertEqual(customer.version, 4)
+        customer.deactivate()
+        self.assertEqual(Customer.find(customer.id).version, 5)
+
+    def test_update_stale_customer(self):
+        """It should not Update a Customer that another writer changed"""
+        if db.engine.dialect.name == "sqlite":
+            self.skipTest("SQLite cannot verify versioned updates")
+        customer = CustomerFactory()
+        customer.create()
+        customer_id = customer.id
+        self._write_elsewhere(customer_id)
+        customer.first_name = "Stale"
+        self.assertRaises(ConflictError, customer.update)
+        self.assertNotEqual(Customer.find(customer_id).first_name, "Stale")
+        self._write_elsewhere(customer_id)
+        self.assertRaises(ConflictError, customer.delete)
+        self.assertIsNotNone(Customer.find(customer_id))
+
+    @staticmethod
+    def _write_elsewhere(customer_id: int):
+        """Changes a Customer's version outside of the session like another request would"""
+        with db.engine.begin() as connection:
+            connection.execute(
+                db.text("UPDATE customer SET version = version + 1 WHERE id = :id"),
+                {"id": customer_id},
+            )
+
+    def test_deserialize_version(self):
+        """It should Deserialize an optional integer version"""
+        data = CustomerFactory().serialize()
+        data["version"] = 3
+        customer = Customer().deserialize(data)
+        self.assertEqual(customer.read_version, 3)
+        self.assertIsNone(customer.version)
+        data["version"] = "3"
+        self.assertRaises(DataValidationError, Customer().deserialize, data)
+
+    def test_deserialize_and_update(self):
+        """It should Update a found Customer whatever version the payload carries"""
+        customer = CustomerFactory()
+        customer.create()
+        data = CustomerFactory().serialize()
+        del data["version"]
+        found = Customer.find(customer.id)
+        found.deserialize(data)
+        found.update()
+        self.assertEqual(Customer.find(customer.id).version, 2)
+        self.assertEqual(Customer.find(customer.id).first_name, data["first_name"])
+
+        data["version"] = 99
+        data["first_name"] = "Changed"
+        found = Customer.find(customer.id)
+        found.deserialize(data)
+        found.update()
+        self.assertEqual(Customer.find(customer.id).version, 3)
+
+    def test_set_status_by_id(self):
+        """It should deactivate and restore a Customer in one statement"""
+        customer = CustomerFactory()
+        customer.create()
+        self.assertFalse(Customer.set_status_by_id(customer.id, False)["active"])
+        self.assertTrue(Customer.set_status_by_id(customer.id, True)["active"])
+        self.assertIsNone(Customer.set_status_by_id(0, True))
+
+    def test_delete_by_id(self):
+        """It should Delete a Customer by id in one statement"""
+        customer = CustomerFactory()
+        customer.create()
+        customer_id = customer.id
+        self.assertTrue(Customer.delete_by_id(customer_id))
+        self.assertFalse(Customer.delete_by_id(customer_id))
+        self.assertEqual(Customer.all(), [])
+
     def test_update_no_id(self):
         """It should not Update a Customer with no id"""
         customer = CustomerFactory()
@@ -194,6 +317,31 @@ class TestCustomer(unittest.TestCase):
             "active": "not Boolean",
         }
         self.assertRaises(DataValidationError, customer.deserialize, data)
+        data["active"] = True
+        data["address"] = 123
+        self.assertRaises(DataValidationError, customer.deserialize, data)
+
+    def test_address_key(self):
+        """It should keep a normalized key of the address and the raw address for display"""
+        data = CustomerFactory().serialize()
+        data["address"] = "123 Main Street, Apt. 4"
+        customer = Customer().deserialize(data)
+        self.assertEqual(customer.address, "123 Main Street, Apt. 4")
+        self.assertEqual(customer.address_key, "123 main st apt 4")
+        customer.create()
+        changes = Customer().deserialize(dict(data, address="9 Oak Avenue"))
+        changes.update_active(customer.id)
+        self.assertEqual(Customer.find(customer.id).address_key, "9 oak ave")
+
+    def test_find_by_address_variants(self):
+        """It should find an address however it is spelled"""
+        customer = CustomerFactory(address="123 Main St.")
+        customer.create()
+        CustomerFactory(address="124 Main St.").create()
+        found = Customer.find_by_address("123  main STREET").all()
+        self.assertEqual([c.id for c in found], [customer.id])
+        found = Customer.search(address=["123 MAIN ST", "9 Oak Ave"]).all()
+        self.assertEqual([c.id for c in found], [customer.id])
 
     def test_find_customer(self):
         """It should Find a Customer by ID"""
@@ -273,3 +421,400 @@ class TestCustomer(unittest.TestCase):
         self.assertEqual(found.count(), count)
         for customer in found:
             self.assertEqual(customer.address, address)
+
+    def test_paginate(self):
+        """It should return Customers a page at a time"""
+        customers = CustomerFactory.create_batch(5)
+        for customer in customers:
+            customer.create()
+        page = Customer.paginate(Customer.query, 2)
+        self.assertEqual([c.id for c in page], [c.id for c in customers[:2]])
+        page = Customer.paginate(Customer.query, 2, page[-1].id)
+        self.assertEqual([c.id for c in page], [c.id for c in customers[2:4]])
+        page = Customer.paginate(Customer.query, 2, page[-1].id)
+        self.assertEqual([c.id for c in page], [customers[4].id])
+        page = Customer.paginate(Customer.query, 2, customers[2].id, ["-id"])
+        self.assertEqual([c.id for c in page], [customers[1].id, customers[0].id])
+
+    def test_paginate_sorted(self):
+        """It should page through Customers in a sort order"""
+        names = [("Ann", "Lee"), ("Bob", "Lee"), ("Cy", "Adams"), ("Ann", "Zane"), ("Bob", "Lee")]
+        for first_name, last_name in names:
+            CustomerFactory(first_name=first_name, last_name=last_name).create()
+        sort = ["last_name", "-first_name"]
+        seen = []
+        page = Customer.paginate(Customer.query, 2, sort=sort)
+        while page:
+            seen.extend(page)
+            page = Customer.paginate(Customer.query, 2, page[-1].id, sort)
+        self.assertEqual(
+            [(c.first_name, c.last_name) for c in seen],
+            [("Cy", "Adams"), ("Bob", "Lee"), ("Bob", "Lee"), ("Ann", "Lee"), ("Ann", "Zane")],
+        )
+        self.assertLess(seen[1].id, seen[2].id)
+
+    def test_sort_order(self):
+        """It should always end the sort order with the id and reject unknown fields"""
+        self.assertEqual(Customer.sort_order(), [(Customer.id, False)])
+        self.assertEqual(
+            Customer.sort_order(["-active"]), [(Customer.status, True), (Customer.id, False)]
+        )
+        self.assertEqual(Customer.sort_order(["-id"]), [(Customer.id, True)])
+        self.assertRaises(DataValidationError, Customer.sort_order, ["password"])
+
+    def test_search(self):
+        """It should AND every filter and match any value of a list"""
+        customers = [
+            CustomerFactory(first_name="Ann", address="1 Main St", status=True),
+            CustomerFactory(first_name="Ann", address="1 Main St", status=False),
+            CustomerFactory(first_name="Bob", address="1 Main St", status=True),
+            CustomerFactory(first_name="Cy", address="2 Elm St", status=True),
+        ]
+        for customer in customers:
+            customer.create()
+        found = Customer.search(address="1 Main St", active=True).order_by(Customer.id).all()
+        self.assertEqual(found, [customers[0], customers[2]])
+        found = Customer.search(first_name=["Ann", "Cy"], active=True).order_by(Customer.id).all()
+        self.assertEqual(found, [customers[0], customers[3]])
+        found = Customer.search(ids=[customers[1].id, customers[2].id], first_name=["Bob"]).all()
+        self.assertEqual(found, [customers[2]])
+        self.assertEqual(Customer.search(last_name=None).count(), 4)
+        self.assertRaises(DataValidationError, Customer.search, password="x")
+
+    def test_count_queries(self):
+        """It should count the statements run inside the block"""
+        customer = CustomerFactory()
+        customer.create()
+        with count_queries() as queries:
+            Customer.query.count()
+            with count_queries() as inner:
+                Customer.find_by_address(customer.address).all()
+        self.assertEqual(inner.count, 1)
+        self.assertEqual(queries.count, 2)
+        self.assertGreaterEqual(queries.seconds, inner.seconds)
+        self.assertTrue(queries.statements[0].startswith("SELECT"))
+        Customer.query.count()
+        self.assertEqual(queries.count, 2)
+
+    def test_create_keeps_state(self):
+        """It should not read a Customer back after creating it"""
+        customer = CustomerFactory()
+        with count_queries() as queries:
+            customer.create()
+            data = customer.serialize()
+        self.assertEqual(queries.count, 2)
+        self.assertEqual(data["version"], 1)
+        self.assertEqual(Customer.find(customer.id).serialize(), data)
+
+    def test_slow_query_log(self):
+        """It should log slow statements without their parameters"""
+        with patch.object(QueryLog, "slow_seconds", 1e-9):
+            with self.assertLogs(app.logger, "WARNING") as logs:
+                Customer.find_by_address("1 Secret Street").all()
+        self.assertIn("Slow SQL statement", logs.output[-1])
+        self.assertIn("parameters redacted", logs.output[-1])
+        self.assertNotIn("secret", logs.output[-1].lower())
+
+    def test_idempotency_key(self):
+        """It should claim a key once and keep its saved response"""
+        self.assertIsNone(IdempotencyKey.claim("a", "print", 60, 60))
+        holder = IdempotencyKey.claim("a", "other", 60, 60)
+        self.assertEqual(holder.fingerprint, "print")
+        self.assertIsNone(holder.status)
+        IdempotencyKey.save("a", 201, "{}", b"body")
+        holder = IdempotencyKey.claim("a", "print", 60, 60)
+        self.assertEqual((holder.status, holder.body), (201, b"body"))
+        IdempotencyKey.release("a")
+        self.assertIsNone(IdempotencyKey.claim("a", "print", 60, 60))
+
+    def test_idempotency_key_lease(self):
+        """It should let a retry take over a key whose request stopped answering"""
+        self.assertIsNone(IdempotencyKey.claim("a", "print", 60, -1))
+        self.assertIsNone(IdempotencyKey.claim("a", "print", 60, 60))
+        holder = IdempotencyKey.claim("a", "print", 60, 60)
+        self.assertIsNone(holder.status)
+        IdempotencyKey.save("a", 201, "{}", b"body")
+        db.session.execute(db.update(IdempotencyKey).values(locked_until=None))
+        db.session.commit()
+        holder = IdempotencyKey.claim("a", "print", 60, 60)
+        self.assertEqual((holder.status, holder.body), (201, b"body"))
+
+    def test_idempotency_key_expires(self):
+        """It should remove expired keys when another key is claimed"""
+        self.assertIsNone(IdempotencyKey.claim("old", "print", -1, 60))
+        self.assertIsNone(IdempotencyKey.claim("new", "print", 60, 60))
+        self.assertEqual([row.key for row in IdempotencyKey.query.all()], ["new"])
+        self.assertIsNone(IdempotencyKey.claim("old", "print", 60, 60))
+
+    def test_count_by_status(self):
+        """It should count Customers by status and last name initial"""
+        for last_name, active in [("Lee", True), ("lane", False), ("Stone", True), ("Lee", True)]:
+            CustomerFactory(last_name=last_name, status=active).create()
+        self.assertEqual(
+            Customer.count_by_status(Customer.query), {"total": 4, "active": 3, "inactive": 1}
+        )
+        counts = Customer.count_by_status(Customer.search(active=True), by_initial=True)
+        self.assertEqual(counts["total"], 3)
+        self.assertEqual(
+            counts["by_last_name_initial"],
+            {"L": {"total": 2, "active": 2, "inactive": 0}, "S": {"total": 1, "active": 1, "inactive": 0}},
+        )
+        counts = Customer.count_by_status(Customer.search(last_name="Nobody"), by_initial=True)
+        self.assertEqual(counts, {"total": 0, "active": 0, "inactive": 0, "by_last_name_initial": {}})
+
+    def test_stream(self):
+        """It should stream every Customer in id order"""
+        customers = CustomerFactory.create_batch(5)
+        for customer in customers:
+            customer.create()
+        streamed = list(Customer.stream(Customer.query, 2))
+        self.assertEqual([c.id for c in streamed], [c.id for c in customers])
+        streamed = list(Customer.stream(Customer.query, 2, customers[1].id, limit=2))
+        self.assertEqual([c.id for c in streamed], [c.id for c in customers[2:4]])
+
+    def test_find_active_many(self):
+        """It should find many active Customers by id in one query"""
+        customers = CustomerFactory.create_batch(3)
+        customers[1].status = False
+        for customer in customers:
+            customer.create()
+        rows = Customer.find_active_many([customers[2].id, customers[1].id, customers[0].id, 0])
+        self.assertEqual(sorted(row.id for row in rows), [customers[0].id, customers[2].id])
+
+    def test_writes_log_changes(self):
+        """It should log a change for every Customer each write touches"""
+        customers = CustomerFactory.create_batch(3)
+        result = Customer.create_many([c.serialize() for c in customers], batch_size=2)
+        ids = result["ids"]
+        customer = Customer.find(ids[0])
+        customer.first_name = "Changed"
+        customer.update()
+        Customer.set_status(Customer.query.filter(Customer.id.in_(ids[1:])), False)
+        Customer.delete_by_id(ids[2])
+        changes = Customer.changes((0, 0), 10)
+        self.assertEqual([c.id for c in changes], ids + [ids[0], ids[1], ids[2], ids[2]])
+        cursors = [(c.txid, c.change_id) for c in changes]
+        self.assertEqual(sorted(cursors), cursors)
+        self.assertEqual(changes[3].first_name, "Changed")
+        self.assertIsNone(changes[-1].first_name)
+        self.assertEqual(Customer.changes(cursors[5], 10), changes[6:])
+
+    def _log_change(self, conn, customer_id: int):
+        """Appends a change on a connection of its own, as another worker would"""
+        conn.execute(
+            CustomerChange.__table__.insert().values(txid=CustomerChange.transaction_id()),
+            {"customer_id": customer_id},
+        )
+
+    @unittest.skipIf(DATABASE_URI.startswith("sqlite"), "SQLite runs one write transaction at a time")
+    def test_changes_wait_for_open_transactions(self):
+        """It should hold back later changes while an earlier transaction is still open"""
+        customer = CustomerFactory()
+        customer.create()
+        cursors = [change.change_id for change in Customer.changes((0, 0), 10)]
+        with db.engine.connect() as conn:
+            self._log_change(conn, customer.id)
+            customer.first_name = "Changed"
+            customer.update()
+            self.assertEqual([change.change_id for change in Customer.changes((0, 0), 10)], cursors)
+            conn.rollback()
+        self.assertEqual(len(Customer.changes((0, 0), 10)), 2)
+
+    @unittest.skipIf(DATABASE_URI.startswith("sqlite"), "SQLite runs one write transaction at a time")
+    def test_changes_later_transaction_lower_id(self):
+        """It should deliver a change whose id is below the cursor when its transaction commits last"""
+        first, second = CustomerFactory(), CustomerFactory()
+        first.create()
+        second.create()
+        after = max((c.txid, c.change_id) for c in Customer.changes((0, 0), 10))
+        with db.engine.connect() as older, db.engine.connect() as newer:
+            older.execute(db.select(db.func.pg_current_xact_id()))  # takes the lower txid
+            self._log_change(newer, second.id)  # takes the lower change id
+            self._log_change(older, first.id)
+            older.commit()
+            served = Customer.changes(after, 10)
+            self.assertEqual([c.id for c in served], [first.id])
+            newer.commit()
+        cursor = (served[-1].txid, served[-1].change_id)
+        self.assertEqual([c.id for c in Customer.changes(cursor, 10)], [second.id])
+
+    def test_prune_changes(self):
+        """It should delete the changes older than the retention period"""
+        customer = CustomerFactory()
+        customer.create()
+        customer.first_name = "Changed"
+        customer.update()
+        old = db.session.get(CustomerChange, Customer.changes((0, 0), 10)[0].change_id)
+        old.changed_at = old.changed_at - timedelta(days=40)
+        db.session.commit()
+        self.assertEqual(CustomerChange.prune(30), 1)
+        self.assertEqual(len(Customer.changes((0, 0), 10)), 1)
+        self.assertEqual(CustomerChange.prune(30), 0)
+
+    def test_find_serialized_uses_cache(self):
+        """It should serve a serialized Customer from the cache"""
+        Customer.cache = LRUCache(10)
+        customer = CustomerFactory()
+        customer.create()
+        data = Customer.find_serialized(customer.id)
+        self.assertEqual(data, customer.serialize())
+        self.assertEqual(Customer.find_serialized(customer.id), data)
+        self.assertEqual(Customer.cache.stats()["hits"], 1)
+        self.assertIsNone(Customer.find_serialized(0))
+
+    def test_writes_invalidate_cache(self):
+        """It should drop a cached Customer when it changes"""
+        Customer.cache = LRUCache(10)
+        customer = CustomerFactory()
+        customer.create()
+        Customer.find_serialized(customer.id)
+        customer.first_name = "Changed"
+        customer.update()
+        self.assertEqual(Customer.find_serialized(customer.id)["first_name"], "Changed")
+        customer.deactivate()
+        self.assertIsNone(Customer.cache.get(customer.id))
+        Customer.find_serialized(customer.id)
+        customer.restore()
+        self.assertIsNone(Customer.cache.get(customer.id))
+        Customer.find_serialized(customer.id)
+        customer.delete()
+        self.assertIsNone(Customer.find_serialized(customer.id))
+
+    ######################################################################
+    #  Q U E R Y   P L A N   T E S T   C A S E S
+    ######################################################################
+
+    def _query_plan(self, query) -> str:
+        """Returns the query plan the database picks for a query"""
+        dialect = db.engine.dialect
+        sql = str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+        if dialect.name == "postgresql":
+            # the tables are tiny so make sure the planner considers the indexes
+            db.session.execute(db.text("SET LOCAL enable_seqscan = off"))
+            rows = db.session.execute(db.text("EXPLAIN " + sql)).all()
+            db.session.rollback()
+            return "\n".join(row[0] for row in rows)
+        rows = db.session.execute(db.text("EXPLAIN QUERY PLAN " + sql)).all()
+        return "\n".join(row[-1] for row in rows)
+
+    def test_indexes_created(self):
+        """It should create an index for every filter path"""
+        index_names = {index["name"] for index in db.inspect(db.engine).get_indexes("customer")}
+        for name in [
+            "ix_customer_first_name",
+            "ix_customer_last_name_first_name",
+            "ix_customer_address_key",
+            "ix_customer_active",
+        ]:
+            self.assertIn(name, index_names)
+
+    def test_upgrade_schema(self):
+        """It should recreate indexes missing from an existing table"""
+        db.session.execute(db.text("DROP INDEX ix_customer_first_name"))
+        db.session.commit()
+        with count_queries() as queries:
+            Customer.upgrade_schema()
+        Customer.upgrade_schema()  # a second run must be a no-op
+        index_names = {index["name"] for index in db.inspect(db.engine).get_indexes("customer")}
+        self.assertIn("ix_customer_first_name", index_names)
+        created = [sql for sql in queries.statements if sql.startswith("CREATE INDEX")]
+        self.assertEqual(len(created), 1)
+        if db.engine.dialect.name == "postgresql":
+            # built without locking out writes to the table
+            self.assertTrue(created[0].startswith("CREATE INDEX CONCURRENTLY ix_customer_first_name"))
+
+    def test_upgrade_schema_adds_columns(self):
+        """It should add columns missing from an existing table"""
+        CustomerFactory().create()
+        db.session.execute(db.text("ALTER TABLE customer DROP COLUMN version"))
+        db.session.commit()
+        Customer.upgrade_schema()
+        columns = {column["name"] for column in db.inspect(db.engine).get_columns("customer")}
+        self.assertIn("version", columns)
+        self.assertEqual(Customer.all()[0].version, 1)
+
+    def test_upgrade_schema_fills_address_keys(self):
+        """It should fill in the address key of Customers saved before it existed"""
+        for address in ("1 Main Street", "2 Oak Avenue", "3 Elm Road"):
+            CustomerFactory(address=address).create()
+        db.session.execute(db.text("DROP INDEX ix_customer_address_key"))
+        db.session.execute(db.text("ALTER TABLE customer DROP COLUMN address_key"))
+        db.session.commit()
+        Customer.upgrade_schema()
+        found = Customer.find_by_address("2 oak ave").all()
+        self.assertEqual([c.address for c in found], ["2 Oak Avenue"])
+        self.assertEqual(Customer.query.filter(Customer.address_key.is_(None)).count(), 0)
+
+    def test_find_queries_use_indexes(self):
+        """It should use an index for every find_by query"""
+        self.assertIn(
+            "ix_customer_first_name", self._query_plan(Customer.find_by_first_name("Ann"))
+        )
+        self.assertIn(
+            "ix_customer_last_name_first_name",
+            self._query_plan(Customer.find_by_last_name("Smith")),
+        )
+        self.assertRegex(
+            self._query_plan(Customer.find_by_name("Ann", "Smith")),
+            "ix_customer_(last_name_)?first_name",
+        )
+        self.assertIn(
+            "ix_customer_address_key", self._query_plan(Customer.find_by_address("1 Main St"))
+        )
+
+    def test_search_uses_indexes(self):
+        """It should use the indexes for combined filters"""
+        self.assertIn(
+            "ix_customer_address_key",
+            self._query_plan(Customer.search(address=["1 Main St"], active=True)),
+        )
+        self.assertRegex(
+            self._query_plan(Customer.search(last_name=["Lee", "Zane"], first_name="Ann")),
+            "ix_customer_(last_name_)?first_name",
+        )
+
+    def test_find_by_text(self):
+        """It should find Customers by part of a name or address, ignoring case"""
+        customers = [
+            CustomerFactory(first_name="Annabel", last_name="Lee", address="1 Main St"),
+            CustomerFactory(first_name="Joanna", last_name="Smith", address="9 Annex Rd"),
+            CustomerFactory(first_name="Bob", last_name="Stone", address="100% Elm St"),
+        ]
+        for customer in customers:
+            customer.create()
+
+        def found(text):
+            return sorted(c.first_name for c in Customer.find_by_text(text))
+
+        self.assertEqual(found("ANN"), ["Annabel", "Joanna"])
+        self.assertEqual(found("an"), ["Annabel"])
+        self.assertEqual(found("main"), ["Annabel"])
+        self.assertEqual(found("0% e"), ["Bob"])
+        self.assertEqual(found("1_0"), [])
+
+    def test_search_text_prefix_first(self):
+        """It should fill a page with the prefix matches before the substring matches"""
+        for first_name in ("Joanna", "Marianne", "Susanna", "Annabel", "Ann"):
+            CustomerFactory(first_name=first_name, last_name="Smith", address="1 Elm St").create()
+
+        def found(text, limit):
+            return sorted(row.first_name for row in Customer.search_text(text, limit))
+
+        self.assertEqual(found("ann", 2), ["Ann", "Annabel"])
+        self.assertEqual(found("ann", 3)[:2], ["Ann", "Annabel"])
+        self.assertEqual(len(found("ann", 3)), 3)
+        self.assertEqual(found("ann", 10), ["Ann", "Annabel", "Joanna", "Marianne", "Susanna"])
+        self.assertEqual(found("an", 10), ["Ann", "Annabel"])
+
+    def test_find_by_text_uses_trigram_indexes(self):
+        """It should search through the trigram indexes on PostgreSQL"""
+        if not trigram_available(None, None, db.session.connection()):
+            self.skipTest("Trigram indexes need PostgreSQL with the pg_trgm extension")
+        plan = self._query_plan(Customer.find_by_text("anna"))
+        for name in ("first_name", "last_name", "address"):
+            self.assertIn(f"ix_customer_{name}_trgm", plan)
+
+    def test_active_customers_use_partial_index(self):
+        """It should use the partial index to page through active Customers"""
+        query = Customer.query.filter(Customer.status == True)  # noqa: E712 pylint: disable=singleton-comparison
+        self.assertIn("ix_customer_active", self._query_plan(query.order_by(Customer.id)))
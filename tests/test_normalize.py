@@ -0,0 +1,23 @@
+"""
+Test cases for the name and address Normalizers
+"""
+from unittest import TestCase
+from service.common.normalize import normalize_text, normalize_address
+
+
+class TestNormalize(TestCase):
+    """Test Cases for normalize_text and normalize_address"""
+
+    def test_normalize_text(self):
+        """It should ignore case, punctuation and extra whitespace"""
+        self.assertEqual(normalize_text("  O'Brien-Smith,\nJR. "), "o brien smith jr")
+        self.assertEqual(normalize_text("ÉMILE"), "émile")
+        self.assertEqual(normalize_text("..."), "")
+
+    def test_normalize_address(self):
+        """It should abbreviate common address words"""
+        self.assertEqual(normalize_address("123 Main St."), "123 main st")
+        self.assertEqual(normalize_address("123  main STREET"), "123 main st")
+        self.assertEqual(
+            normalize_address("9 North Oak Avenue, Apartment #4"), "9 n oak ave apt 4"
+        )
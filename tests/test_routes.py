@@ -5,14 +5,28 @@ Test cases can be run with the following:
   nosetests -v --with-spec --spec-color
   coverage report -m
 """
+# pylint: disable=too-many-lines
 import os
+import gzip
+import json
 import logging
+import shutil
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch, MagicMock
 from urllib.parse import quote_plus
+import brotli
+import cbor2
+import msgpack
+from prometheus_client import REGISTRY
 from service import app
 
-from service.models import db, init_db, Customer
+from service.models import db, init_db, Customer, CustomerChange
+from service.common.cache import LRUCache
 from service.common import status  # HTTP Status Codes
+from service.common.compression import precompress_static
+from service.common.idempotency import IdempotencyKey, MemoryStore, DatabaseStore
+from service.common.query_log import QueryBudgetExceeded, count_queries
 from tests.factories import CustomerFactory
 
 DATABASE_URI = os.getenv(
@@ -47,10 +61,13 @@ class TestYourResourceServer(TestCase):
         """Runs before each test"""
         self.client = app.test_client()
         db.session.query(Customer).delete()  # clean up the last tests
+        db.session.query(CustomerChange).delete()
+        db.session.query(IdempotencyKey).delete()
         db.session.commit()
 
     def tearDown(self):
         db.session.remove()
+        Customer.cache = LRUCache()
 
     ######################################################################
     #  P L A C E   T E S T   C A S E S   H E R E
@@ -62,6 +79,102 @@ class TestYourResourceServer(TestCase):
         data = response.get_json()
         self.assertEqual(data["status"], "OK")
 
+    def test_liveness(self):
+        """It should be alive without asking the database"""
+        with patch("service.routes.database_check") as check_mock:
+            response = self.client.get("/health/live")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        check_mock.check.assert_not_called()
+
+    def test_readiness(self):
+        """It should be ready while the database answers"""
+        response = self.client.get("/health/ready")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["status"], "OK")
+        self.assertEqual(data["database"]["status"], "up")
+        self.assertGreater(data["pool"]["size"], 0)
+
+    def test_not_ready(self):
+        """It should drop out of rotation when the database does not answer"""
+        with patch("service.routes.database_check") as check_mock:
+            check_mock.check.return_value = {"status": "down", "error": "OperationalError: gone"}
+            response = self.client.get("/health/ready")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.get_json()["database"]["error"], "OperationalError: gone")
+
+    def test_request_metrics(self):
+        """It should count requests and their SQL statements by route template"""
+        route = "/api/customers/<int:customer_id>"
+        labels = {"method": "GET", "route": route, "status": "404"}
+        before = REGISTRY.get_sample_value("http_requests_total", labels) or 0
+        queries = REGISTRY.get_sample_value("db_queries_per_request_sum", {"route": route}) or 0
+        response = self.client.get(f"{BASE_URL}/0")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(REGISTRY.get_sample_value("http_requests_total", labels), before + 1)
+        self.assertGreaterEqual(REGISTRY.get_sample_value("db_queries_per_request_sum", {"route": route}), queries + 1)
+        self.assertEqual(REGISTRY.get_sample_value("http_requests_in_flight", {"method": "GET", "route": route}), 0)
+
+        self.client.get("/no/such/path")
+        labels = {"method": "GET", "route": "<unmatched>", "status": "404"}
+        self.assertGreaterEqual(REGISTRY.get_sample_value("http_requests_total", labels), 1)
+
+    def test_metrics(self):
+        """It should expose the metrics in the Prometheus text format"""
+        self.client.get("/health")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        text = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{method="GET",route="/health",status="200"}', text)
+        self.assertIn('http_requests_in_flight{method="GET",route="/metrics"} 1.0', text)
+        self.assertIn("db_pool_checked_out", text)
+
+    def test_query_counts(self):
+        """It should run a fixed number of SQL statements per endpoint"""
+        customer = self._create_customers(1)[0]
+        db.session.remove()
+        requests = [
+            (1, "GET", f"{BASE_URL}/{customer.id}", None),
+            (1, "GET", BASE_URL, None),
+            (1, "GET", f"{BASE_URL}?limit=1&after={customer.id}", None),
+            (1, "GET", f"{BASE_URL}?sort=-id&limit=1&after={customer.id}", None),
+            (2, "PUT", f"{BASE_URL}/{customer.id}", customer.serialize()),
+            (2, "PUT", f"{BASE_URL}/{customer.id}/deactivate", None),
+            (2, "POST", BASE_URL, CustomerFactory().serialize()),
+            (2, "DELETE", f"{BASE_URL}/{customer.id}", None),
+        ]
+        for expected, method, url, payload in requests:
+            with count_queries() as queries:
+                self.client.open(url, method=method, json=payload)
+            db.session.remove()
+            self.assertEqual(queries.count, expected, f"{method} {url}: {queries.statements}")
+
+    def test_query_budget(self):
+        """It should fail under test and warn otherwise when a request runs too many statements"""
+        payload = CustomerFactory().serialize()
+        with patch.dict(app.config, {"QUERY_BUDGET": 1}):
+            self.assertRaises(QueryBudgetExceeded, self.client.post, BASE_URL, json=payload)
+            db.session.rollback()
+            with patch.dict(app.config, {"TESTING": False}):
+                with self.assertLogs(app.logger, "WARNING") as logs:
+                    response = self.client.post(BASE_URL, json=payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn("over the budget of 1", logs.output[-1])
+
+    def test_trace_request(self):
+        """It should trace argument parsing, SQL and encoding of a sampled request"""
+        self._create_customers(2)
+        exporter = MagicMock()
+        with patch.dict(app.extensions, {"trace_exporter": exporter}):
+            with patch.dict(app.config, {"TRACE_SAMPLE_RATE": 1.0}):
+                response = self.client.get(BASE_URL, query_string="sort=last_name")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("traceparent", response.headers)
+        names = [span.name for span in exporter.export.call_args.args[0]]
+        self.assertEqual(names, ["parse_args", "db SELECT", "encode", "GET /api/customers"])
+        self.assertNotIn("traceparent", self.client.get(BASE_URL).headers)
+
     def _create_customers(self, count):
         """Factory method to create customers in bulk"""
         customers = []
@@ -78,6 +191,12 @@ class TestYourResourceServer(TestCase):
             customers.append(test_customer)
         return customers
 
+    def _next_page(self, response):
+        """Returns the url of the next page from the Link header"""
+        link = response.headers["Link"]
+        self.assertTrue(link.endswith('rel="next"'))
+        return link[link.index("<") + 1:link.index(">")]
+
     def test_index(self):
         """It should call the home page"""
         resp = self.client.get("/")
@@ -92,6 +211,114 @@ class TestYourResourceServer(TestCase):
         data = response.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_get_customer_list_paginated(self):
+        """It should page through Customers with a next link"""
+        customers = self._create_customers(5)
+        response = self.client.get(BASE_URL, query_string="limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([c["id"] for c in data], [c.id for c in customers[:2]])
+        self.assertIn('rel="next"', response.headers["Link"])
+        response = self.client.get(self._next_page(response))
+        data = response.get_json()
+        self.assertEqual([c["id"] for c in data], [c.id for c in customers[2:4]])
+        response = self.client.get(self._next_page(response))
+        data = response.get_json()
+        self.assertEqual([c["id"] for c in data], [customers[4].id])
+        self.assertNotIn("Link", response.headers)
+
+    def test_get_customer_list_page_size_capped(self):
+        """It should never return more than the maximum page size"""
+        self._create_customers(3)
+        max_size = app.config["MAX_PAGE_SIZE"]
+        app.config["MAX_PAGE_SIZE"] = 2
+        try:
+            response = self.client.get(BASE_URL, query_string="limit=100")
+        finally:
+            app.config["MAX_PAGE_SIZE"] = max_size
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertIn("limit=2", response.headers["Link"])
+
+    def test_get_customer_list_paginated_with_filter(self):
+        """It should keep the filters in the next link"""
+        customers = self._create_customers(3)
+        for customer in customers:
+            customer.last_name = "Smith"
+            response = self.client.put(
+                f"{BASE_URL}/{customer.id}", json=customer.serialize()
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(BASE_URL, query_string="last_name=Smith&limit=2")
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertIn("last_name=Smith", response.headers["Link"])
+        response = self.client.get(self._next_page(response))
+        self.assertEqual(len(response.get_json()), 1)
+
+    def test_get_customer_list_combined_filters(self):
+        """It should apply every filter, including active, to the list"""
+        customers = self._create_customers(4)
+        for customer, first_name in zip(customers, ["Ann", "Ann", "Bob", "Cy"]):
+            customer.first_name = first_name
+            customer.address = "1 Main St"
+            self.client.put(f"{BASE_URL}/{customer.id}", json=customer.serialize())
+        self.client.put(f"{BASE_URL}/{customers[1].id}/deactivate")
+        response = self.client.get(
+            BASE_URL, query_string="address=1+Main+St&first_name=Ann&active=true"
+        )
+        self.assertEqual([c["id"] for c in response.get_json()], [str(customers[0].id)])
+        response = self.client.get(
+            BASE_URL, query_string="first_name=Ann&first_name=Cy&active=false"
+        )
+        self.assertEqual([c["id"] for c in response.get_json()], [str(customers[1].id)])
+        response = self.client.get(BASE_URL, query_string=f"ids={customers[2].id},{customers[3].id}")
+        self.assertEqual(len(response.get_json()), 2)
+
+    def test_get_customer_list_sorted(self):
+        """It should sort the list and keep the sort across pages"""
+        customers = self._create_customers(3)
+        for customer, last_name in zip(customers, ["B", "C", "A"]):
+            customer.last_name = last_name
+            self.client.put(f"{BASE_URL}/{customer.id}", json=customer.serialize())
+        query = "&".join(f"first_name={quote_plus(c.first_name)}" for c in customers)
+        response = self.client.get(BASE_URL, query_string=f"sort=-last_name&limit=2&{query}")
+        self.assertEqual(response.headers["Link"].count("first_name="), 3)
+        names = [c["last_name"] for c in response.get_json()]
+        response = self.client.get(self._next_page(response))
+        names += [c["last_name"] for c in response.get_json()]
+        self.assertEqual(names, ["C", "B", "A"])
+        response = self.client.get(BASE_URL, query_string="sort=password")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_customer_list_bad_limit(self):
+        """It should not accept a page size of zero"""
+        response = self.client.get(BASE_URL, query_string="limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_customer_list(self):
+        """It should stream Customers as NDJSON when asked to"""
+        customers = self._create_customers(3)
+        response = self.client.get(BASE_URL, headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        data = [json.loads(line) for line in lines]
+        self.assertEqual([c["id"] for c in data], [c.id for c in customers])
+        self.assertEqual(data[0]["first_name"], customers[0].first_name)
+
+    def test_stream_customer_list_with_parameter(self):
+        """It should stream Customers with stream=true and honor the limit"""
+        customers = self._create_customers(3)
+        response = self.client.get(
+            BASE_URL, query_string=f"stream=true&after={customers[0].id}&limit=1"
+        )
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [customers[1].id])
+        response = self.client.get(BASE_URL, query_string="stream=false")
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(len(response.get_json()), 3)
+
     def test_get_customer(self):
         """It should Get a single Customer"""
         # create a customer to read
@@ -110,6 +337,294 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(data["last_name"], test_customer.last_name)
         self.assertEqual(data["address"], test_customer.address)
 
+    def test_get_customer_cached(self):
+        """It should serve repeated reads from the cache until the Customer changes"""
+        Customer.cache = LRUCache(10)
+        customer = self._create_customers(1)[0]
+        for _ in range(3):
+            response = self.client.get(f"{BASE_URL}/{customer.id}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get("/cache/stats")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = response.get_json()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+
+        response = self.client.put(f"{BASE_URL}/{customer.id}/deactivate")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{BASE_URL}/{customer.id}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_customer_not_modified(self):
+        """It should answer a conditional Get with 304 until the Customer changes"""
+        customer = self._create_customers(1)[0]
+        response = self.client.get(f"{BASE_URL}/{customer.id}")
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, f'"{customer.id}-1"')
+        response = self.client.get(
+            f"{BASE_URL}/{customer.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(len(response.data), 0)
+
+        response = self.client.put(
+            f"{BASE_URL}/{customer.id}", json=customer.serialize()
+        )
+        self.assertEqual(response.headers["ETag"], f'"{customer.id}-2"')
+        response = self.client.get(
+            f"{BASE_URL}/{customer.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_depends_on_media_type(self):
+        """It should give each media type of a Customer its own ETag"""
+        customer = self._create_customers(1)[0]
+        response = self.client.get(
+            f"{BASE_URL}/{customer.id}", headers={"Accept": "application/msgpack"}
+        )
+        self.assertEqual(response.headers["ETag"], f'"{customer.id}-1-msgpack"')
+        response = self.client.get(
+            f"{BASE_URL}/{customer.id}", headers={"If-None-Match": response.headers["ETag"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_customer_list_not_modified(self):
+        """It should answer a conditional list Get with 304 until a Customer changes"""
+        customers = self._create_customers(3)
+        response = self.client.get(BASE_URL, query_string="limit=2")
+        etag = response.headers["ETag"]
+        response = self.client.get(
+            BASE_URL, query_string="limit=2", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn("Link", response.headers)
+
+        response = self.client.put(f"{BASE_URL}/{customers[2].id}/deactivate")
+        response = self.client.get(
+            BASE_URL, query_string="limit=2", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_update_customer_if_match(self):
+        """It should only Update a Customer whose ETag matches If-Match"""
+        customer = self._create_customers(1)[0]
+        url = f"{BASE_URL}/{customer.id}"
+        response = self.client.put(
+            url, json=customer.serialize(), headers={"If-Match": f'"{customer.id}-2"'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.put(
+            url, json=customer.serialize(), headers={"If-Match": f'"{customer.id}-1"'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(
+            url, json=customer.serialize(), headers={"If-Match": f'"{customer.id}-1"'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.put(url, json=customer.serialize(), headers={"If-Match": "*"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(
+            f"{BASE_URL}/0", json=customer.serialize(), headers={"If-Match": '"0-1"'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_customer_version_conflict(self):
+        """It should not Update a Customer with a stale version in the body"""
+        customer = self._create_customers(1)[0]
+        url = f"{BASE_URL}/{customer.id}"
+        data = self.client.get(url).get_json()
+        self.assertEqual(data["version"], 1)
+        response = self.client.put(url, json=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["version"], 2)
+        response = self.client.put(url, json=data)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn("no longer at version 1", response.get_json()["message"])
+        data["version"] = "2"
+        response = self.client.put(url, json=data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_lookup_customers(self):
+        """It should Get many Customers in request order and report the missing ids"""
+        customers = self._create_customers(3)
+        self.client.put(f"{BASE_URL}/{customers[1].id}/deactivate")
+        ids = [customers[2].id, 0, customers[0].id, customers[1].id, customers[2].id]
+        response = self.client.get(
+            f"{BASE_URL}/lookup", query_string={"ids": ",".join(map(str, ids))}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(
+            [c["id"] for c in data["customers"]], [str(customers[2].id), str(customers[0].id)]
+        )
+        self.assertEqual(data["customers"][1]["first_name"], customers[0].first_name)
+        self.assertEqual(data["missing"], ["0", str(customers[1].id)])
+
+    def test_lookup_customers_bad_ids(self):
+        """It should not look up a missing, bad or too long list of ids"""
+        response = self.client.get(f"{BASE_URL}/lookup")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/lookup", query_string="ids=1,x")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        ids = ",".join(str(i) for i in range(app.config["MAX_PAGE_SIZE"] + 1))
+        response = self.client.get(f"{BASE_URL}/lookup", query_string={"ids": ids})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_customers(self):
+        """It should find Customers as the user types, best matches first"""
+        customers = self._create_customers(3)
+        for customer, (first_name, address) in zip(
+            customers, [("Joanna", "2 Elm St"), ("Bob", "3 Joan Rd"), ("Joan", "4 Oak St")]
+        ):
+            customer.first_name = first_name
+            customer.last_name = "Smith"
+            customer.address = address
+            self.client.put(f"{BASE_URL}/{customer.id}", json=customer.serialize())
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=joan")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [c["first_name"] for c in response.get_json()]
+        self.assertEqual(names, ["Joan", "Joanna", "Bob"])
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=joan&limit=1")
+        self.assertEqual(len(response.get_json()), 1)
+
+    def test_search_customers_no_text(self):
+        """It should not search without any text"""
+        response = self.client.get(f"{BASE_URL}/search")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=+")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def _check_idempotent_create(self):
+        """Posts a Customer twice with one Idempotency-Key and checks it was created once"""
+        payload = CustomerFactory().serialize()
+        headers = {"Idempotency-Key": "create-1"}
+        first = self.client.post(BASE_URL, json=payload, headers=headers)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        retry = self.client.post(BASE_URL, json=payload, headers=headers)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.get_json(), first.get_json())
+        for name in ("Location", "ETag", "Content-Type"):
+            self.assertEqual(retry.headers[name], first.headers[name])
+        self.assertEqual(Customer.query.count(), 1)
+
+        payload["first_name"] = "Other"
+        response = self.client.post(BASE_URL, json=payload, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Customer.query.count(), 1)
+
+    def test_create_customer_idempotent(self):
+        """It should replay the first response to retries with the same Idempotency-Key"""
+        with patch("service.routes.idempotency_store", MemoryStore(10, 60)):
+            self._check_idempotent_create()
+
+    def test_create_customer_idempotent_database(self):
+        """It should share Idempotency-Keys between workers through the database"""
+        with patch("service.routes.idempotency_store", DatabaseStore(60, 60)):
+            self._check_idempotent_create()
+            self.assertEqual(IdempotencyKey.query.count(), 1)
+
+    def test_create_customer_idempotent_errors(self):
+        """It should not keep failed requests and reject keys in progress"""
+        store = MemoryStore(10, 60)
+        with patch("service.routes.idempotency_store", store):
+            headers = {"Idempotency-Key": "create-2"}
+            response = self.client.post(BASE_URL, json={"first_name": "Ann"}, headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            payload = CustomerFactory().serialize()
+            response = self.client.post(BASE_URL, json=payload, headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+            payload = CustomerFactory().serialize()
+            response = self.client.post(BASE_URL, json=payload, headers={"Idempotency-Key": ""})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            store.claim("create-3", "busy")
+            response = self.client.post(BASE_URL, json=payload, headers={"Idempotency-Key": "create-3"})
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_customer_stats(self):
+        """It should count Customers with the list filters"""
+        customers = self._create_customers(3)
+        self.client.put(f"{BASE_URL}/{customers[0].id}/deactivate")
+        response = self.client.get(f"{BASE_URL}/stats")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"total": 3, "active": 2, "inactive": 1})
+        response = self.client.get(
+            f"{BASE_URL}/stats", query_string={"first_name": customers[1].first_name, "by_initial": "true"}
+        )
+        data = response.get_json()
+        initial = customers[1].last_name[0].upper()
+        self.assertGreaterEqual(data["by_last_name_initial"][initial]["total"], 1)
+        self.assertEqual(sum(c["total"] for c in data["by_last_name_initial"].values()), data["total"])
+        response = self.client.get(f"{BASE_URL}/stats", query_string={"by_initial": "maybe"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_customer_stats_cache(self):
+        """It should reuse recent statistics until they expire"""
+        self._create_customers(2)
+        with patch("service.routes.stats_cache", LRUCache(10, 60)):
+            self.assertEqual(self.client.get(f"{BASE_URL}/stats").get_json()["total"], 2)
+            self._create_customers(1)
+            self.assertEqual(self.client.get(f"{BASE_URL}/stats").get_json()["total"], 2)
+        self.assertEqual(self.client.get(f"{BASE_URL}/stats").get_json()["total"], 3)
+
+    def test_count_customers(self):
+        """It should return the number of matching Customers on HEAD"""
+        customers = self._create_customers(3)
+        self.client.put(f"{BASE_URL}/{customers[0].id}/deactivate")
+        response = self.client.head(BASE_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["X-Total-Count"], "3")
+        self.assertEqual(response.data, b"")
+        response = self.client.head(BASE_URL, query_string={"active": "true"})
+        self.assertEqual(response.headers["X-Total-Count"], "2")
+
+    def test_customer_changes(self):
+        """It should list each changed Customer once at its latest change"""
+        customers = self._create_customers(3)
+        response = self.client.get(f"{BASE_URL}/changes")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([c["id"] for c in data["changes"]], [str(c.id) for c in customers])
+        cursor = data["cursor"]
+
+        self.client.put(f"{BASE_URL}/{customers[0].id}", json=customers[0].serialize())
+        self.client.put(f"{BASE_URL}/{customers[2].id}/deactivate")
+        self.client.delete(f"{BASE_URL}/{customers[1].id}")
+        self.client.put(f"{BASE_URL}/{customers[0].id}/deactivate")
+        data = self.client.get(f"{BASE_URL}/changes", query_string={"since": cursor}).get_json()
+        changes = data["changes"]
+        self.assertEqual([c["id"] for c in changes], [str(customers[i].id) for i in (2, 1, 0)])
+        self.assertFalse(changes[0]["customer"]["active"])
+        self.assertTrue(changes[1]["deleted"])
+        self.assertIsNone(changes[1]["customer"])
+        self.assertEqual(changes[2]["customer"]["version"], 3)
+        self.assertEqual(data["cursor"], changes[-1]["cursor"])
+
+        data = self.client.get(f"{BASE_URL}/changes", query_string={"since": data["cursor"]}).get_json()
+        self.assertEqual(data["changes"], [])
+        self.assertEqual(data["cursor"], changes[-1]["cursor"])
+
+    def test_customer_changes_paginated(self):
+        """It should page through the changes with a Link header"""
+        customers = self._create_customers(3)
+        response = self.client.get(f"{BASE_URL}/changes", query_string="limit=2")
+        self.assertEqual(len(response.get_json()["changes"]), 2)
+        response = self.client.get(self._next_page(response))
+        data = response.get_json()
+        self.assertEqual([c["id"] for c in data["changes"]], [str(customers[2].id)])
+        self.assertNotIn("Link", response.headers)
+
+    def test_customer_changes_bad_cursor(self):
+        """It should not accept a cursor the change feed did not return"""
+        for since in ("abc", "1-2-3", "-1", "1"):
+            response = self.client.get(f"{BASE_URL}/changes", query_string={"since": since})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, since)
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": "0"})
+        self.assertEqual(response.get_json()["cursor"], "0-0")
+
     def test_get_customer_not_found(self):
         """It should not Get a Customer thats not found"""
         response = self.client.get(f"{BASE_URL}/0")
@@ -241,6 +756,139 @@ class TestYourResourceServer(TestCase):
         for customer in address_customers:
             self.assertEqual(customer["address"], test_address)
 
+    def test_query_customer_list_by_address_variant(self):
+        """Query Customers by another spelling of their address"""
+        customer = self._create_customers(1)[0]
+        customer.address = "123 Main Street, Apt. 4"
+        self.client.put(f"{BASE_URL}/{customer.id}", json=customer.serialize())
+        response = self.client.get(BASE_URL, query_string={"address": "123 main st apt 4"})
+        data = response.get_json()
+        self.assertEqual([c["address"] for c in data], ["123 Main Street, Apt. 4"])
+
+    def test_bulk_create_customers(self):
+        """It should Create many Customers from a JSON array"""
+        customers = [CustomerFactory().serialize() for _ in range(5)]
+        app.config["BULK_BATCH_SIZE"], batch_size = 2, app.config["BULK_BATCH_SIZE"]
+        try:
+            response = self.client.post(f"{BASE_URL}/bulk", json=customers)
+        finally:
+            app.config["BULK_BATCH_SIZE"] = batch_size
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(data["errors"], [])
+        self.assertEqual(len(data["ids"]), 5)
+        for customer_id, customer in zip(data["ids"], customers):
+            found = Customer.find(int(customer_id))
+            self.assertEqual(found.first_name, customer["first_name"])
+
+    def test_bulk_create_customers_ndjson(self):
+        """It should Create Customers from NDJSON and report the bad lines"""
+        lines = [json.dumps(CustomerFactory().serialize()) for _ in range(3)]
+        lines.insert(1, "{not json")
+        lines.insert(3, json.dumps({"first_name": "Missing"}))
+        response = self.client.post(
+            f"{BASE_URL}/bulk",
+            data="\n".join(lines) + "\n\n",
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(len(data["ids"]), 5)
+        self.assertEqual([data["ids"][i] is None for i in range(5)], [False, True, False, True, False])
+        self.assertEqual([error["index"] for error in data["errors"]], [1, 3])
+        self.assertEqual(len(Customer.all()), 3)
+
+    def test_bulk_create_customers_database_error(self):
+        """It should only reject the records the database refuses"""
+        customers = [CustomerFactory().serialize() for _ in range(3)]
+        if db.engine.dialect.name == "sqlite":
+            self.skipTest("SQLite does not enforce string lengths")
+        customers[1]["first_name"] = "x" * 100
+        response = self.client.post(f"{BASE_URL}/bulk", json=customers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertIsNone(data["ids"][1])
+        self.assertEqual(data["errors"][0]["index"], 1)
+        self.assertEqual(len(Customer.all()), 2)
+
+    def test_bulk_create_customers_atomic(self):
+        """It should Create none of the Customers in atomic mode if one is bad"""
+        customers = [CustomerFactory().serialize() for _ in range(3)]
+        del customers[2]["address"]
+        response = self.client.post(
+            f"{BASE_URL}/bulk", query_string="atomic=true", json=customers
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data = response.get_json()
+        self.assertEqual(data["ids"], [None, None, None])
+        self.assertEqual(data["errors"][0]["index"], 2)
+        self.assertEqual(Customer.all(), [])
+
+    def test_bulk_deactivate_and_restore_by_ids(self):
+        """It should deactivate and restore a list of Customers"""
+        customers = self._create_customers(3)
+        ids = f"{customers[0].id},{customers[2].id}"
+        response = self.client.put(f"{BASE_URL}/bulk/deactivate", query_string=f"ids={ids}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], 2)
+        db.session.remove()
+        self.assertEqual([c.status for c in Customer.query.order_by(Customer.id)], [False, True, False])
+        response = self.client.put(f"{BASE_URL}/bulk/restore", query_string="active=false")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], 2)
+        db.session.remove()
+        self.assertEqual([c.status for c in Customer.query.order_by(Customer.id)], [True, True, True])
+
+    def test_bulk_ids_in_body(self):
+        """It should take more ids from a JSON body than fit in a request line"""
+        customers = self._create_customers(3)
+        # gunicorn refuses request lines longer than 4094 bytes
+        ids = [int(customers[0].id), customers[2].id] + list(range(10**6, 10**6 + 1000))
+        self.assertGreater(len(",".join(str(customer_id) for customer_id in ids)), 4094)
+        response = self.client.put(f"{BASE_URL}/bulk/deactivate", json={"ids": ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], 2)
+        response = self.client.put(f"{BASE_URL}/bulk/restore", json={"ids": ids})
+        self.assertEqual(response.get_json()["count"], 2)
+        response = self.client.delete(f"{BASE_URL}/bulk", json={"ids": ids})
+        self.assertEqual(response.get_json()["count"], 2)
+        db.session.remove()
+        self.assertEqual([str(c.id) for c in Customer.all()], [customers[1].id])
+
+    def test_bulk_ids_in_body_bad_request(self):
+        """It should reject a body without a list of integer ids, or ids in both places"""
+        customer = self._create_customers(1)[0]
+        for body in ({"ids": "1,2"}, {"ids": [1, "two"]}, {"ids": [True]}, [1, 2], {}):
+            response = self.client.delete(f"{BASE_URL}/bulk", json=body)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        response = self.client.delete(
+            f"{BASE_URL}/bulk", query_string=f"ids={customer.id}", json={"ids": [customer.id]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(Customer.all()), 1)
+
+    def test_bulk_delete_by_filter(self):
+        """It should delete every Customer matching a filter"""
+        customers = self._create_customers(3)
+        response = self.client.delete(
+            f"{BASE_URL}/bulk",
+            query_string=f"last_name={quote_plus(customers[1].last_name)}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        count = response.get_json()["count"]
+        self.assertGreaterEqual(count, 1)
+        self.assertEqual(len(Customer.all()), 3 - count)
+        response = self.client.get(f"{BASE_URL}/{customers[1].id}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deactivate_customer_is_saved(self):
+        """It should commit the deactivation of a Customer"""
+        customer = self._create_customers(1)[0]
+        response = self.client.put(f"{BASE_URL}/{customer.id}/deactivate")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        db.session.remove()
+        self.assertFalse(Customer.find(int(customer.id)).status)
+
     ######################################################################
     #  T E S T   S A D   P A T H S
     ######################################################################
@@ -271,6 +919,25 @@ class TestYourResourceServer(TestCase):
         response = self.client.post(BASE_URL, json={})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_bulk_create_not_a_list(self):
+        """It should not Create Customers in bulk from a single object"""
+        response = self.client.post(f"{BASE_URL}/bulk", json=CustomerFactory().serialize())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_operation_without_filters(self):
+        """It should refuse to change every Customer at once"""
+        self._create_customers(2)
+        response = self.client.delete(f"{BASE_URL}/bulk")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(f"{BASE_URL}/bulk/deactivate")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(Customer.all()), 2)
+
+    def test_bulk_operation_bad_ids(self):
+        """It should not accept ids that are not integers"""
+        response = self.client.put(f"{BASE_URL}/bulk/restore", query_string="ids=1,two")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_method_not_allowed(self):
         """It should use method not defined in routes"""
         response = self.client.put(BASE_URL)
@@ -292,3 +959,140 @@ class TestYourResourceServer(TestCase):
         """It should return 404 not found"""
         response = self.client.put(f"{BASE_URL}/987654321/deactivate")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    ######################################################################
+    #  C O N T E N T   N E G O T I A T I O N
+    ######################################################################
+
+    def test_get_customer_msgpack(self):
+        """It should return a Customer as MessagePack when asked to"""
+        customer = self._create_customers(1)[0]
+        response = self.client.get(
+            f"{BASE_URL}/{customer.id}", headers={"Accept": "application/msgpack"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/msgpack")
+        data = msgpack.unpackb(response.data)
+        self.assertEqual(data["id"], customer.id)
+        self.assertEqual(data["first_name"], customer.first_name)
+
+    def test_list_customers_cbor(self):
+        """It should return a list of Customers as CBOR when asked to"""
+        self._create_customers(3)
+        response = self.client.get(BASE_URL, headers={"Accept": "application/cbor"})
+        self.assertEqual(response.mimetype, "application/cbor")
+        self.assertEqual(len(cbor2.loads(response.data)), 3)
+
+    def test_create_and_update_customer_msgpack(self):
+        """It should accept MessagePack bodies for create and update"""
+        customer = CustomerFactory().serialize()
+        headers = {"Content-Type": "application/msgpack", "Accept": "application/msgpack"}
+        response = self.client.post(BASE_URL, data=msgpack.packb(customer), headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = msgpack.unpackb(response.data)
+        created["address"] = "unknown"
+        response = self.client.put(
+            f"{BASE_URL}/{created['id']}", data=msgpack.packb(created), headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(msgpack.unpackb(response.data)["address"], "unknown")
+
+    def test_json_is_the_default(self):
+        """It should fall back to JSON for unknown or wildcard Accept headers"""
+        customer = self._create_customers(1)[0]
+        for accept in ["*/*", "text/html", "application/xml"]:
+            response = self.client.get(f"{BASE_URL}/{customer.id}", headers={"Accept": accept})
+            self.assertEqual(response.mimetype, "application/json")
+
+    def test_create_customer_bad_msgpack(self):
+        """It should not Create a Customer from a malformed MessagePack body"""
+        response = self.client.post(
+            BASE_URL, data=b"\xc1", headers={"Content-Type": "application/msgpack"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    ######################################################################
+    #  C O M P R E S S I O N
+    ######################################################################
+
+    def test_compress_large_listing(self):
+        """It should gzip a large JSON response"""
+        for _ in range(20):
+            CustomerFactory().create()
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        data = app.json.loads(gzip.decompress(response.data))
+        self.assertEqual(len(data), 20)
+
+    def test_prefer_brotli(self):
+        """It should use brotli when the client accepts it"""
+        for _ in range(20):
+            CustomerFactory().create()
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(len(app.json.loads(brotli.decompress(response.data))), 20)
+
+    def test_small_or_unaccepted_not_compressed(self):
+        """It should not compress small responses or without Accept-Encoding"""
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        for _ in range(20):
+            CustomerFactory().create()
+        response = self.client.get(BASE_URL)
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_compressed_etag(self):
+        """It should mark the ETag of a compressed listing with its encoding"""
+        for _ in range(20):
+            CustomerFactory().create()
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip"})
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.endswith('-gzip"'))
+        response = self.client.get(
+            BASE_URL, headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_static_compressed_in_memory(self):
+        """It should serve a compressed static asset without pre-built files"""
+        response = self.client.get("/static/js/rest_api.js", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        with open(os.path.join(app.static_folder, "js", "rest_api.js"), "rb") as file:
+            self.assertEqual(gzip.decompress(response.data), file.read())
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.endswith('-gzip"'))
+        self.assertIn("Last-Modified", response.headers)
+        response = self.client.get(
+            "/static/js/rest_api.js", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.data, b"")
+        response = self.client.get("/", headers={"Accept-Encoding": "br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(response.mimetype, "text/html")
+        self.assertTrue(response.headers["ETag"].endswith('-br"'))
+
+    def test_static_precompressed(self):
+        """It should serve the pre-built files written by precompress_static"""
+        static_folder = app.static_folder
+        folder = tempfile.mkdtemp()
+        try:
+            shutil.copytree(static_folder, folder, dirs_exist_ok=True)
+            # index.html, four stylesheets and three scripts in two encodings
+            self.assertEqual(precompress_static(folder), 8 * 2)
+            with open(os.path.join(folder, "index.html.gz"), "wb") as file:
+                file.write(gzip.compress(b"prebuilt"))
+            app.static_folder = folder
+            response = self.client.get("/", headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(gzip.decompress(response.get_data()), b"prebuilt")
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            response = self.client.get("/static/images/newapp-icon.png", headers={"Accept-Encoding": "gzip"})
+            self.assertNotIn("Content-Encoding", response.headers)
+            response.close()
+        finally:
+            app.static_folder = static_folder
+            shutil.rmtree(folder)
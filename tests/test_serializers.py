@@ -0,0 +1,47 @@
+"""
+Test cases for the fast Serializers
+"""
+import json
+from collections import namedtuple
+from unittest import TestCase
+from flask_restx import marshal
+from service.common.serializers import ModelSerializer, JSON, dumps, encode
+from service.routes import customer_model
+from tests.factories import CustomerFactory
+
+Row = namedtuple("Row", ["id", "first_name", "last_name", "address", "status", "version"])
+
+
+class TestModelSerializer(TestCase):
+    """Test Cases for ModelSerializer"""
+
+    def setUp(self):
+        self.serializer = ModelSerializer(customer_model, {"active": "status"})
+
+    def test_from_dict_matches_marshal(self):
+        """It should produce the same output as marshal()"""
+        data = CustomerFactory().serialize()
+        self.assertEqual(self.serializer.from_dict(data), marshal(data, customer_model))
+        self.assertIsInstance(self.serializer.from_dict(data)["id"], str)
+
+    def test_from_row_matches_marshal(self):
+        """It should serialize result rows like marshal() serializes dictionaries"""
+        customer = CustomerFactory()
+        row = Row(*[customer.serialize()[key] for key in ("id", "first_name", "last_name", "address", "active", "version")])
+        self.assertEqual(
+            self.serializer.from_row(row), marshal(customer.serialize(), customer_model)
+        )
+
+    def test_none_values(self):
+        """It should leave missing values as null like marshal()"""
+        data = {"id": None, "first_name": None, "last_name": "x", "address": None, "active": None, "version": None}
+        self.assertEqual(self.serializer.from_dict(data), marshal(data, customer_model))
+
+    def test_encode_json(self):
+        """It should encode serialized rows as JSON bytes the way the routes do"""
+        customers = CustomerFactory.create_batch(3)
+        rows = [Row(c.id, c.first_name, c.last_name, c.address, c.status, c.version) for c in customers]
+        data = json.loads(encode([self.serializer.from_row(row) for row in rows], JSON))
+        self.assertEqual([c["id"] for c in data], [str(c.id) for c in customers])
+        self.assertEqual(data[0]["first_name"], customers[0].first_name)
+        self.assertEqual(json.loads(dumps({"name": "Zoë"})), {"name": "Zoë"})
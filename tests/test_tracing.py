@@ -0,0 +1,143 @@
+"""
+Test cases for the request Tracing
+"""
+import json
+import os
+import tempfile
+from unittest import TestCase
+from flask import Flask
+from sqlalchemy import create_engine, text
+from service.common.tracing import Span, FileExporter, init_tracing, otlp_value, span, SERVER, CLIENT
+
+
+class RecordingExporter:  # pylint: disable=too-few-public-methods
+    """Keeps the exported traces in memory"""
+
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        """Records the spans of one trace"""
+        self.traces.append(spans)
+
+
+def make_app(sample_rate: float):
+    """Returns a Flask app with tracing and a route that queries SQLite"""
+    app = Flask("tracing_test")
+    app.config.update(TRACE_SAMPLE_RATE=sample_rate, TRACE_FILE="unused.jsonl")
+    exporter = RecordingExporter()
+    init_tracing(app, exporter)
+    engine = create_engine("sqlite://")
+
+    @app.route("/items/<int:item_id>")
+    def item(item_id):
+        with span("lookup", {"item": item_id}):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT :id"), {"id": item_id}).scalar()
+        return "item"
+
+    @app.route("/broken")
+    def broken():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT * FROM missing"))
+        return "never"
+
+    return app, exporter
+
+
+class TestSpan(TestCase):
+    """Test Cases for Span"""
+
+    def test_child(self):
+        """It should collect the spans of a trace in one list"""
+        root = Span("root", "a" * 32, kind=SERVER)
+        child = root.child("child", CLIENT, {"rows": 2})
+        child.finish(ValueError("bad"))
+        root.finish()
+        self.assertEqual(root.trace, [child, root])
+        data = child.to_otlp()
+        self.assertEqual(data["traceId"], "a" * 32)
+        self.assertEqual(data["parentSpanId"], root.span_id)
+        self.assertEqual(data["kind"], CLIENT)
+        self.assertEqual(data["attributes"], [{"key": "rows", "value": {"intValue": "2"}}])
+        self.assertEqual(data["status"]["message"], "ValueError: bad")
+        self.assertNotIn("parentSpanId", root.to_otlp())
+        self.assertNotIn("status", root.to_otlp())
+
+    def test_otlp_value(self):
+        """It should encode attribute values the way OTLP JSON does"""
+        self.assertEqual(otlp_value(True), {"boolValue": True})
+        self.assertEqual(otlp_value(1.5), {"doubleValue": 1.5})
+        self.assertEqual(otlp_value("x"), {"stringValue": "x"})
+
+    def test_span_without_trace(self):
+        """It should do nothing outside a traced request"""
+        with span("idle") as idle:
+            self.assertIsNone(idle)
+
+    def test_file_exporter(self):
+        """It should append each trace as one OTLP JSON line"""
+        root = Span("root", "b" * 32)
+        root.finish()
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "traces.jsonl")
+            exporter = FileExporter(path)
+            exporter.export(root.trace)
+            exporter.export(root.trace)
+            with open(path, encoding="utf-8") as file:
+                lines = file.readlines()
+        self.assertEqual(len(lines), 2)
+        resource_spans = json.loads(lines[0])["resourceSpans"][0]
+        self.assertEqual(resource_spans["resource"]["attributes"][0]["value"], {"stringValue": "customers"})
+        self.assertEqual(resource_spans["scopeSpans"][0]["spans"][0]["name"], "root")
+
+
+class TestRequestTracing(TestCase):
+    """Test Cases for the tracing request hooks"""
+
+    def test_sampled_request(self):
+        """It should trace a request with its SQL statements and return a traceparent"""
+        app, exporter = make_app(1.0)
+        response = app.test_client().get("/items/7")
+        trace_id, span_id, flags = response.headers["traceparent"].split("-")[1:]
+        self.assertEqual(flags, "01")
+        self.assertEqual(len(exporter.traces), 1)
+        spans = {s.name: s for s in exporter.traces[0]}
+        self.assertEqual(set(spans), {"GET /items/<int:item_id>", "lookup", "db SELECT"})
+        root = spans["GET /items/<int:item_id>"]
+        self.assertEqual((root.trace_id, root.span_id), (trace_id, span_id))
+        self.assertEqual(root.attributes["http.status_code"], 200)
+        self.assertEqual(spans["lookup"].parent_id, root.span_id)
+        self.assertEqual(spans["db SELECT"].parent_id, spans["lookup"].span_id)
+        self.assertEqual(spans["db SELECT"].attributes["db.statement"], "SELECT ?")
+
+    def test_unsampled_request(self):
+        """It should not trace requests that were not sampled"""
+        app, exporter = make_app(0.0)
+        response = app.test_client().get("/items/7")
+        self.assertNotIn("traceparent", response.headers)
+        self.assertEqual(exporter.traces, [])
+
+    def test_incoming_traceparent(self):
+        """It should continue the caller's trace and follow its sampling decision"""
+        app, exporter = make_app(0.0)
+        parent = f"00-{'c' * 32}-{'d' * 16}-01"
+        response = app.test_client().get("/items/7", headers={"traceparent": parent})
+        self.assertTrue(response.headers["traceparent"].startswith(f"00-{'c' * 32}-"))
+        root = exporter.traces[0][-1]
+        self.assertEqual(root.parent_id, "d" * 16)
+
+        app, exporter = make_app(1.0)
+        parent = f"00-{'c' * 32}-{'d' * 16}-00"
+        response = app.test_client().get("/items/7", headers={"traceparent": parent})
+        self.assertEqual(response.headers["traceparent"], parent)
+        self.assertEqual(exporter.traces, [])
+
+    def test_failed_statement(self):
+        """It should mark the span of a failed SQL statement as an error"""
+        app, exporter = make_app(1.0)
+        app.config["TESTING"] = False
+        response = app.test_client().get("/broken")
+        self.assertEqual(response.status_code, 500)
+        statement = next(s for s in exporter.traces[0] if s.name == "db SELECT")
+        self.assertIn("no such table", statement.error)